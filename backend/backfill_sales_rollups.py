@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import sys
+import time
+
+# Importing the server loads .env and connects to MONGO_URL / DB_NAME
+import server
+from server import ensure_indexes, rebuild_sales_rollups, SALES_ROLLUP_BATCH_SIZE
+
+async def backfill(batch_size: int):
+    """Rebuild the daily sales rollups from every order in the database"""
+    await ensure_indexes()
+    start = time.perf_counter()
+    result = await rebuild_sales_rollups(batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Rolled up {result['orders']} orders in {elapsed:.1f}s")
+    if result["orders_priced"]:
+        print(f"   {result['orders_priced']} older orders were priced from the current catalog")
+    return True
+
+async def main(batch_size: int):
+    try:
+        return await backfill(batch_size)
+    finally:
+        server.client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the daily sales rollups from existing orders")
+    parser.add_argument("--batch-size", type=int, default=SALES_ROLLUP_BATCH_SIZE)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args.batch_size)) else 1)
@@ -0,0 +1,102 @@
+import asyncio
+import sys
+from datetime import datetime, timezone
+
+# Importing the server loads .env and connects to MONGO_URL / DB_NAME
+import server
+from server import (
+    db, ensure_indexes, keyset_filter, plan_stages, PRODUCT_SORT_KEYS,
+    users_collection, products_collection, categories_collection,
+    orders_collection, sessions_collection, email_outbox_collection, revoked_tokens_collection,
+    sales_rollups_collection
+)
+
+# Representative queries issued by the API handlers: (description, collection, filter, sort)
+def handler_queries():
+    now = datetime.now(timezone.utc)
+    queries = [
+        ("get_current_user", users_collection, {"id": "user"}, None),
+        ("login/register", users_collection, {"email": "user@example.com"}, None),
+        ("get_product", products_collection, {"id": "product"}, None),
+        ("get_products_batch / price_order_items", products_collection, {"id": {"$in": ["a", "b"]}}, None),
+        ("export_products", products_collection, {}, [("id", 1)]),
+        ("reserve_inventory", products_collection, {"id": "product", "inventory": {"$gte": 1}}, None),
+        ("release_inventory", products_collection, {"id": "product", "pending_reservations": "order"}, None),
+        ("admin stats low stock", products_collection, {"inventory": {"$lt": 10}}, [("inventory", 1), ("id", 1)]),
+        ("admin stats orders in period", orders_collection, {"created_at": {"$gte": now}}, None),
+        ("update/delete_category", categories_collection, {"id": "category"}, None),
+        ("update_order_status / delete_order", orders_collection, {"id": "order"}, None),
+        ("get_orders (admin)", orders_collection, {}, [("created_at", -1), ("id", -1)]),
+        ("get_orders (admin, next page)", orders_collection,
+         keyset_filter("created_at", now, "order", ascending=False), [("created_at", -1), ("id", -1)]),
+        ("get_orders (customer)", orders_collection, {"user_id": "user"}, [("created_at", -1), ("id", -1)]),
+        ("get_orders (customer, next page)", orders_collection,
+         {"user_id": "user", **keyset_filter("created_at", now, "order", ascending=False)},
+         [("created_at", -1), ("id", -1)]),
+        ("sales rollup update", sales_rollups_collection,
+         {"day": "2024-01-01", "product_id": "product", "category_id": "category", "delivery_option": "standard"}, None),
+        ("get_sales_report", sales_rollups_collection, {"day": {"$gte": "2024-01-01", "$lte": "2024-01-31"}}, None),
+        ("rebuild_sales_rollups", orders_collection, {"status": {"$ne": "cancelled"}}, [("created_at", 1), ("id", 1)]),
+        ("get_current_user_with_session", sessions_collection,
+         {"session_token": "token", "expires_at": {"$gt": now}}, None),
+        ("logout", sessions_collection, {"session_token": "token"}, None),
+        ("session sweep", sessions_collection, {"expires_at": {"$lte": now}}, None),
+        ("email outbox claim", email_outbox_collection, {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "locked_until": {"$lte": now}}
+        ]}, [("next_attempt_at", 1)]),
+        ("email outbox update", email_outbox_collection, {"id": "email"}, None),
+        ("token revocation sync", revoked_tokens_collection, {"revoked_at": {"$gte": now}}, None),
+    ]
+
+    sample_values = {"created_at": now, "price": 1000.0, "name": "Shirt"}
+    for sort_key in PRODUCT_SORT_KEYS:
+        for filters in ({}, {"category_id": "category"}, {"featured": True}):
+            for ascending in (True, False):
+                direction = 1 if ascending else -1
+                sort = [(sort_key, direction), ("id", direction)]
+                label = f"get_products {filters or 'all'} by {sort_key} {'asc' if ascending else 'desc'}"
+                queries.append((label, products_collection, filters, sort))
+                queries.append((label + " (next page)", products_collection,
+                                {**filters, **keyset_filter(sort_key, sample_values[sort_key], "product", ascending)}, sort))
+    return queries
+
+async def check_indexes():
+    """Reconcile indexes, then verify every handler query is served by one"""
+    report = await ensure_indexes()
+    print(f"Indexes created: {len(report['created'])}, rebuilt: {len(report['rebuilt'])}")
+    for label in report["undeclared"]:
+        print(f"⚠️ Undeclared index: {label}")
+    for error in report["errors"]:
+        print(f"❌ Index error: {error}")
+
+    failures = len(report["errors"])
+    for label, collection_name, filter_query, sort in handler_queries():
+        cursor = db[collection_name].find(filter_query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.limit(101).explain()
+        stages = plan_stages(explanation["queryPlanner"]["winningPlan"])
+
+        if "COLLSCAN" in stages:
+            failures += 1
+            print(f"❌ {label}: collection scan on {collection_name}")
+        elif sort and "SORT" in stages:
+            print(f"⚠️ {label}: uses an index but sorts in memory")
+        else:
+            print(f"✅ {label}")
+
+    if failures:
+        print(f"\n{failures} problem(s) found")
+    else:
+        print("\nEvery handler query is served by an index")
+    return failures == 0
+
+async def main():
+    try:
+        return await check_indexes()
+    finally:
+        server.client.close()
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Importing the server loads .env and connects to MONGO_URL / DB_NAME
+import server
+from server import (
+    export_products, import_products, iter_lines,
+    PRODUCT_IMPORT_BATCH_SIZE, PRODUCT_EXPORT_BATCH_SIZE
+)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+def file_format(path: Path, requested):
+    if requested:
+        return requested
+    return "csv" if path.suffix.lower() == ".csv" else "ndjson"
+
+async def read_chunks(path: Path):
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK_SIZE):
+            yield chunk
+
+async def run_import(args):
+    path = Path(args.file)
+    start = time.perf_counter()
+    report = await import_products(
+        iter_lines(read_chunks(path)), file_format(path, args.format), args.batch_size, args.dry_run
+    )
+    elapsed = time.perf_counter() - start
+    
+    action = "Validated" if args.dry_run else "Imported"
+    print(f"{'✅' if not report['error_count'] else '⚠️'} {action} {report['rows']} rows in {elapsed:.1f}s: "
+          f"{report['inserted']} inserted, {report['updated']} updated, {report['error_count']} errors")
+    for error in report["errors"]:
+        print(f"❌ Row {error['row']}{' (' + error['id'] + ')' if error['id'] else ''}: {error['error']}")
+    if report["error_count"] > len(report["errors"]):
+        print(f"   ... and {report['error_count'] - len(report['errors'])} more")
+    return report["error_count"] == 0
+
+async def run_export(args):
+    path = Path(args.file)
+    start = time.perf_counter()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        async for chunk in export_products(file_format(path, args.format), args.batch_size):
+            f.write(chunk)
+    print(f"✅ Exported the catalog to {path} in {time.perf_counter() - start:.1f}s")
+    return True
+
+async def main(args):
+    try:
+        return await (run_import(args) if args.command == "import" else run_export(args))
+    finally:
+        server.client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk product import and export (CSV or NDJSON)")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    
+    import_parser = subcommands.add_parser("import", help="upsert products from a file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    import_parser.add_argument("--batch-size", type=int, default=PRODUCT_IMPORT_BATCH_SIZE)
+    import_parser.add_argument("--dry-run", action="store_true", help="validate rows without writing")
+    
+    export_parser = subcommands.add_parser("export", help="write the catalog to a file")
+    export_parser.add_argument("file")
+    export_parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    export_parser.add_argument("--batch-size", type=int, default=PRODUCT_EXPORT_BATCH_SIZE)
+    
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
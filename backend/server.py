@@ -1,13 +1,38 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Response, Request, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Response, Request, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Match
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING, monitoring
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 import os
+import re
+import io
+import csv
+import json
+import base64
+import codecs
+import math
+import time
+import bisect
+import random
+import hashlib
+import hmac
+import smtplib
+import asyncio
 import logging
+import tempfile
+import threading
+import functools
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from typing import List, Optional, Dict, Set, Literal, get_args
 import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
@@ -16,13 +41,497 @@ from jwt import PyJWTError as JWTError
 from passlib.context import CryptContext
 import aiohttp
 import yagmail  # Email sending library
+from cachetools import TTLCache
+import orjson
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics
+# Counters and histograms rendered in the Prometheus text format on /metrics.
+# Every thread records into its own table (pymongo runs the command listener on
+# Motor's executor threads), so recording takes no lock; a scrape sums the
+# tables. Label sets beyond METRICS_MAX_SERIES per metric are counted as "other".
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Off by default without a token; METRICS_ENABLED=true with no token serves
+# /metrics to anyone, so only do that behind a network that keeps it private.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true' if METRICS_TOKEN else 'false').lower() == 'true'
+METRICS_MAX_SERIES = int(os.environ.get('METRICS_MAX_SERIES', '500'))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metric:
+    """A counter, or a histogram when buckets are given, with fixed label names"""
+
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple = None):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._local = threading.local()
+        self._tables = []
+        self._series = set()
+        self._overflow = ("other",) * len(labels)
+        self._full = False
+        # Only taken the first time a thread records or a label set is seen, until the series are full
+        self._lock = threading.Lock()
+
+    def _row(self, label_values: tuple) -> list:
+        table = getattr(self._local, "table", None)
+        if table is None:
+            table = self._local.table = {}
+            with self._lock:
+                self._tables.append(table)
+        row = table.get(label_values)
+        if row is None:
+            if label_values not in self._series and (self._full or not self._admit(label_values)):
+                # Rejected label sets share the "other" row and are never stored, so memory stays bounded
+                label_values = self._overflow
+                row = table.get(label_values)
+            if row is None:
+                # Histogram rows hold one count per bucket plus +Inf, then the sum
+                row = table[label_values] = [0] * (len(self.buckets) + 2 if self.buckets else 1)
+        return row
+
+    def _admit(self, label_values: tuple) -> bool:
+        with self._lock:
+            if label_values in self._series or len(self._series) < METRICS_MAX_SERIES:
+                self._series.add(label_values)
+                return True
+            self._series.add(self._overflow)
+            self._full = True
+            return False
+
+    def inc(self, *label_values, amount=1):
+        self._row(label_values)[0] += amount
+
+    def observe(self, value: float, *label_values):
+        row = self._row(label_values)
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {'histogram' if self.buckets else 'counter'}"]
+        with self._lock:
+            tables = list(self._tables)
+            series = sorted(self._series)
+        for label_values in series:
+            rows = [table[label_values] for table in tables if label_values in table]
+            totals = [sum(column) for column in zip(*rows)]
+            labels = ",".join(f'{name}="{_label_value(value)}"' for name, value in zip(self.labels, label_values))
+            if not self.buckets:
+                lines.append(f"{self.name}{{{labels}}} {totals[0]}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), totals):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {totals[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+http_request_seconds = Metric(
+    "saahaz_http_request_duration_seconds", "Request latency by route template and status code",
+    ("method", "route", "status"), LATENCY_BUCKETS
+)
+mongo_command_seconds = Metric(
+    "saahaz_mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ("collection", "command", "outcome"), LATENCY_BUCKETS
+)
+mongo_documents = Metric(
+    "saahaz_mongo_documents_total", "Documents returned or written by MongoDB commands",
+    ("collection", "command")
+)
+
+def _command_collection(event) -> str:
+    collection = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+    return collection if isinstance(collection, str) else "none"
+
+def _reply_documents(reply) -> int:
+    """Documents a command returned (cursor batches) or matched and wrote (n)"""
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if "lastErrorObject" in reply:
+        return reply["lastErrorObject"].get("n", 0)
+    return reply.get("n", 0)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command the Motor client sends, per collection and command"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        self._collections[(event.connection_id, event.request_id)] = _command_collection(event)
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "none")
+        mongo_command_seconds.observe(event.duration_micros / 1e6, collection, event.command_name, "ok")
+        documents = _reply_documents(event.reply)
+        if documents:
+            mongo_documents.inc(collection, event.command_name, amount=documents)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "none")
+        mongo_command_seconds.observe(event.duration_micros / 1e6, collection, event.command_name, "error")
+
+# Slow query log
+# Commands slower than SLOW_QUERY_MS are kept (newest SLOW_QUERY_LOG_SIZE) with
+# their filter shape, literal values replaced by "?". A sample of them is
+# explained in the background to show whether they scanned the collection.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))  # 0 disables the log
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '200'))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE', '0.2'))
+# Command -> where its filter lives; None for commands with a pipeline instead
+SLOW_QUERY_COMMANDS = {
+    "find": "filter", "count": "query", "distinct": "query", "findAndModify": "query",
+    "update": "updates", "delete": "deletes", "aggregate": None,
+}
+
+def redact_shape(value):
+    """Keep keys, operators and $field references; replace literal values with "?" """
+    if isinstance(value, dict):
+        return {key: redact_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if any(isinstance(item, (dict, list)) for item in value):
+            return [redact_shape(item) for item in value]
+        return "?"
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+def plan_stages(plan) -> list:
+    """All stage names in an explain plan, whatever the server's explain format"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+def _find_values(document, key: str) -> list:
+    """Every value stored under `key` anywhere in a nested explain output"""
+    found = []
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                found.append(value)
+            else:
+                found.extend(_find_values(value, key))
+    elif isinstance(document, list):
+        for value in document:
+            found.extend(_find_values(value, key))
+    return found
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Command listener keeping the slow commands and explaining a sample of them"""
+
+    def __init__(self, threshold_ms: float, size: int, explain_sample: float):
+        self.threshold = threshold_ms * 1000  # event durations are in microseconds
+        self.explain_sample = explain_sample
+        self.entries = deque(maxlen=size)
+        self.loop = None  # set on startup; explains run on the event loop
+        self._commands = {}
+        self._explaining = False
+
+    def started(self, event):
+        if event.command_name in SLOW_QUERY_COMMANDS:
+            self._commands[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event):
+        command = self._commands.pop((event.connection_id, event.request_id), None)
+        if command is not None and event.duration_micros >= self.threshold:
+            self.record(event.command_name, command, event.duration_micros / 1000, event.database_name)
+
+    def failed(self, event):
+        self._commands.pop((event.connection_id, event.request_id), None)
+
+    def record(self, command_name: str, command: dict, duration_ms: float, database: str):
+        filter_key = SLOW_QUERY_COMMANDS[command_name]
+        if filter_key is None:
+            shape = {"pipeline": redact_shape(command.get("pipeline", []))}
+        elif filter_key in ("updates", "deletes"):
+            statements = command.get(filter_key) or [{}]
+            shape = {"filter": redact_shape(statements[0].get("q", {})), "statements": len(statements)}
+        else:
+            shape = {"filter": redact_shape(command.get(filter_key, {}))}
+        if command.get("sort"):
+            shape["sort"] = dict(command["sort"])
+
+        entry = {
+            "at": datetime.now(timezone.utc),
+            "collection": command.get(command_name),
+            "command": command_name,
+            "duration_ms": round(duration_ms, 2),
+            "shape": shape,
+            "explain": None
+        }
+        self.entries.append(entry)
+        if self.loop and not self._explaining and random.random() < self.explain_sample:
+            self._explaining = True
+            # Drop driver fields such as lsid and $clusterTime; explain adds its own
+            explainable = {k: v for k, v in command.items() if not k.startswith("$") and k not in ("lsid", "txnNumber")}
+            asyncio.run_coroutine_threadsafe(self.explain(entry, database, explainable), self.loop)
+        else:
+            logger.warning(f"🐢 Slow {command_name} on {entry['collection']}: {entry['duration_ms']}ms {shape}")
+
+    async def explain(self, entry: dict, database: str, command: dict):
+        """Run the command again under explain and attach the plan summary to the entry"""
+        try:
+            result = await client[database].command({"explain": command, "verbosity": "executionStats"})
+            stages = []
+            for plan in _find_values(result, "winningPlan"):
+                stages.extend(plan_stages(plan))
+            stats = (_find_values(result, "executionStats") or [{}])[0]
+            entry["explain"] = {
+                "collscan": "COLLSCAN" in stages,
+                "stages": stages,
+                "docs_examined": stats.get("totalDocsExamined"),
+                "keys_examined": stats.get("totalKeysExamined"),
+                "returned": stats.get("nReturned"),
+            }
+        except Exception as e:
+            entry["explain"] = {"error": str(e)}
+        finally:
+            self._explaining = False
+        scan = " COLLSCAN" if entry["explain"].get("collscan") else ""
+        logger.warning(f"🐢 Slow {entry['command']} on {entry['collection']}: {entry['duration_ms']}ms{scan} {entry['shape']}")
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_EXPLAIN_SAMPLE)
+
+# Tracing
+# A sampled request gets a root span with child spans for the auth dependencies,
+# every MongoDB command it sends and the emails it queues. Unsampled requests
+# cost one random() call and a context variable lookup per command. Finished
+# spans are buffered and exported in batches by a background task, as NDJSON
+# to TRACE_FILE or as OTLP/HTTP JSON to TRACE_OTLP_ENDPOINT.
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))  # 0 disables tracing
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'file')  # file or otlp
+TRACE_FILE = os.environ.get('TRACE_FILE', os.path.join(tempfile.gettempdir(), 'saahaz-traces.ndjson'))
+TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'saahaz-backend')
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', '10000'))  # oldest spans are dropped past this
+TRACE_EXPORT_BATCH_SIZE = int(os.environ.get('TRACE_EXPORT_BATCH_SIZE', '512'))
+TRACE_EXPORT_INTERVAL_SECONDS = float(os.environ.get('TRACE_EXPORT_INTERVAL_SECONDS', '5'))
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_finished_spans = deque(maxlen=TRACE_BUFFER_SIZE)
+
+class Span:
+    """One timed operation; used as a context manager it becomes the current span"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error", "_token")
+
+    def __init__(self, name: str, trace_id: str = None, parent_id: str = None, kind: str = "internal",
+                 attributes: dict = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind  # internal, server or client
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.finish()
+        return False
+
+    def child(self, name: str, kind: str = "internal", **attributes) -> "Span":
+        return Span(name, self.trace_id, self.span_id, kind, attributes)
+
+    def finish(self, end_ns: int = None):
+        self.end_ns = end_ns or time.time_ns()
+        _finished_spans.append(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class _NoSpan:
+    """Stands in for a span when the request is not sampled"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NO_SPAN = _NoSpan()
+
+def start_span(name: str, kind: str = "internal", **attributes):
+    """Child of the current span, or a no-op outside a sampled request"""
+    parent = _current_span.get()
+    if parent is None:
+        return NO_SPAN
+    return parent.child(name, kind, **attributes)
+
+def root_span(name: str, kind: str = "internal", parent: Optional[dict] = None, **attributes):
+    """Continue the trace recorded in `parent`, or start a new one at TRACE_SAMPLE_RATE"""
+    if not TRACE_SAMPLE_RATE:
+        return NO_SPAN
+    if parent:
+        return Span(name, parent["trace_id"], parent["span_id"], kind, attributes)
+    if random.random() < TRACE_SAMPLE_RATE:
+        return Span(name, kind=kind, attributes=attributes)
+    return NO_SPAN
+
+def current_trace() -> Optional[dict]:
+    """Ids to continue the current trace from work done later, e.g. by the email outbox"""
+    span = _current_span.get()
+    return {"trace_id": span.trace_id, "span_id": span.span_id} if span else None
+
+def traced(name: str):
+    """Run an async function (FastAPI dependencies included) inside a child span"""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with start_span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class MongoCommandTracing(monitoring.CommandListener):
+    """Child span per MongoDB command sent while a sampled span is current"""
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        # Motor runs pymongo in a copy of the caller's context, so the request span is visible here
+        parent = _current_span.get()
+        if parent is not None:
+            self._spans[(event.connection_id, event.request_id)] = parent.child(
+                f"mongo.{event.command_name}", "client",
+                **{"db.system": "mongodb", "db.operation": event.command_name,
+                   "db.mongodb.collection": _command_collection(event)}
+            )
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, event.failure)
+
+    def _finish(self, event, failure):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            if failure:
+                span.error = str(failure)
+            span.finish(span.start_ns + event.duration_micros * 1000)
+
+_trace_http_session: Optional[aiohttp.ClientSession] = None
+_trace_export_task: Optional[asyncio.Task] = None
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_payload(spans: List[Span]) -> dict:
+    """Spans as an OTLP/HTTP JSON ExportTraceServiceRequest"""
+    kinds = {"internal": 1, "server": 2, "client": 3}
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": kinds[span.kind],
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "saahaz"}, "spans": otlp_spans}]
+    }]}
+
+def _write_span_file(spans: List[Span]):
+    with open(TRACE_FILE, "ab") as f:
+        f.write(b"".join(orjson.dumps(span.to_dict(), option=orjson.OPT_APPEND_NEWLINE) for span in spans))
+
+async def _post_otlp(spans: List[Span]):
+    global _trace_http_session
+    if _trace_http_session is None or _trace_http_session.closed:
+        _trace_http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    async with _trace_http_session.post(TRACE_OTLP_ENDPOINT, data=orjson.dumps(otlp_payload(spans)),
+                                        headers={"Content-Type": "application/json"}) as resp:
+        resp.raise_for_status()
+
+async def export_spans():
+    """Export every buffered span; a failed batch is dropped rather than retried"""
+    while _finished_spans:
+        batch = []
+        while _finished_spans and len(batch) < TRACE_EXPORT_BATCH_SIZE:
+            batch.append(_finished_spans.popleft())
+        try:
+            if TRACE_EXPORTER == "otlp":
+                await _post_otlp(batch)
+            else:
+                await asyncio.to_thread(_write_span_file, batch)
+        except Exception as e:
+            print(f"⚠️ Dropped {len(batch)} spans, trace export failed: {str(e)}")
+            return
+
+async def _trace_export_loop():
+    while True:
+        await asyncio.sleep(TRACE_EXPORT_INTERVAL_SECONDS)
+        await export_spans()
+
+async def stop_tracing():
+    """Flush the spans still buffered and close the exporter's HTTP client"""
+    await export_spans()
+    if _trace_http_session is not None:
+        await _trace_http_session.close()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+command_listeners = []
+if METRICS_ENABLED:
+    command_listeners.append(MongoCommandMetrics())
+if SLOW_QUERY_MS > 0:
+    command_listeners.append(slow_query_log)
+if TRACE_SAMPLE_RATE > 0:
+    command_listeners.append(MongoCommandTracing())
+client = AsyncIOMotorClient(mongo_url, event_listeners=command_listeners)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -33,9 +542,15 @@ api_router = APIRouter(prefix="/api")
 
 # Security setup
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
+ACCESS_TOKEN_TTL_MINUTES = int(os.environ.get('ACCESS_TOKEN_TTL_MINUTES', '15'))
+REFRESH_TOKEN_TTL_DAYS = int(os.environ.get('REFRESH_TOKEN_TTL_DAYS', '7'))
+
+# Upper bound on ids accepted by the batch product lookup
+PRODUCT_BATCH_MAX_IDS = int(os.environ.get('PRODUCT_BATCH_MAX_IDS', '100'))
 
 # Database Collections
 users_collection = "users"
@@ -43,6 +558,123 @@ products_collection = "products"
 orders_collection = "orders"
 categories_collection = "categories"
 sessions_collection = "sessions"  # For Google OAuth sessions
+email_outbox_collection = "email_outbox"  # Queued customer emails
+revoked_tokens_collection = "revoked_tokens"  # Logged out tokens, shared between workers
+catalog_meta_collection = "catalog_meta"  # Shared catalog version counter
+sales_rollups_collection = "sales_rollups"  # Daily sales per product, category and delivery option
+
+# Database indexes, reconciled against the live collections on startup
+PRODUCT_SORT_KEYS = ("created_at", "price", "name")
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', '30'))
+
+REQUIRED_INDEXES = {
+    users_collection: [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    products_collection: [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Every filter/sort combination of the product listing is served by one of these
+        *[
+            IndexModel(prefix + [(sort_key, ASCENDING), ("id", ASCENDING)])
+            for sort_key in PRODUCT_SORT_KEYS
+            for prefix in ([], [("category_id", ASCENDING)], [("featured", ASCENDING)])
+        ],
+        IndexModel([("inventory", ASCENDING), ("id", ASCENDING)]),  # Low stock alerts
+    ],
+    categories_collection: [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    orders_collection: [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    sessions_collection: [
+        IndexModel([("session_token", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING)]),
+        # Mongo deletes sessions as soon as they expire
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    email_outbox_collection: [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)]),
+        # Sent emails are kept for a while for support questions, then dropped
+        IndexModel([("sent_at", ASCENDING)], expireAfterSeconds=EMAIL_OUTBOX_RETENTION_DAYS * 24 * 60 * 60),
+    ],
+    sales_rollups_collection: [
+        # Upsert target of every rollup update; also serves date range reports
+        IndexModel([("day", ASCENDING), ("product_id", ASCENDING), ("category_id", ASCENDING),
+                    ("delivery_option", ASCENDING)], unique=True),
+    ],
+    revoked_tokens_collection: [
+        IndexModel([("revoked_at", ASCENDING)]),
+        # Revocations are only needed until the token would have expired anyway
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+_INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+def _index_key(spec) -> tuple:
+    """Key fields and directions; numeric directions are normalised (1.0 == 1), others such as "text" kept"""
+    return tuple(
+        (field, int(direction) if isinstance(direction, (int, float)) else direction)
+        for field, direction in (spec.items() if isinstance(spec, dict) else spec)
+    )
+
+def _index_options(spec: dict) -> dict:
+    # Compare by identity: expireAfterSeconds=0 is a real TTL, while unique=False is the default
+    return {option: spec[option] for option in _INDEX_OPTIONS if spec.get(option) is not None and spec.get(option) is not False}
+
+index_report: dict = {}
+
+async def ensure_indexes() -> dict:
+    """Create missing indexes, rebuild ones whose options drifted and report undeclared ones"""
+    report = {"created": [], "rebuilt": [], "undeclared": [], "errors": []}
+    for collection_name, models in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        try:
+            existing = await collection.index_information()
+            existing_by_key = {_index_key(info["key"]): (name, info) for name, info in existing.items()}
+        except Exception as e:
+            report["errors"].append(f"{collection_name}: {str(e)}")
+            continue
+        declared_keys = set()
+        
+        for model in models:
+            wanted = model.document
+            key = _index_key(wanted["key"])
+            declared_keys.add(key)
+            current = existing_by_key.get(key)
+            label = f"{collection_name}.{wanted['name']}"
+            try:
+                if current is None:
+                    await collection.create_indexes([model])
+                    report["created"].append(label)
+                elif _index_options(current[1]) != _index_options(wanted):
+                    await collection.drop_index(current[0])
+                    await collection.create_indexes([model])
+                    report["rebuilt"].append(label)
+            except Exception as e:
+                report["errors"].append(f"{label}: {str(e)}")
+        
+        for key, (name, _) in existing_by_key.items():
+            if name != "_id_" and key not in declared_keys:
+                report["undeclared"].append(f"{collection_name}.{name}")
+    
+    for kind in ("created", "rebuilt"):
+        for label in report[kind]:
+            logger.info(f"Index {kind}: {label}")
+    for label in report["undeclared"]:
+        logger.warning(f"Index drift: {label} exists but is not declared")
+    for error in report["errors"]:
+        logger.error(f"Index reconciliation failed for {error}")
+    
+    index_report.clear()
+    index_report.update(report, checked_at=datetime.now(timezone.utc))
+    return report
 
 # Pydantic Models
 class User(BaseModel):
@@ -65,6 +697,19 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class AdminFlagUpdate(BaseModel):
+    is_admin: bool
+
+class TokenClaims(BaseModel):
+    user_id: str
+    is_admin: bool = False
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class Product(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -149,127 +794,137 @@ class OrderCreate(BaseModel):
     subtotal: Optional[float] = 0
     total: Optional[float] = 0
 
+class ProductSearchResults(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[Product]
+
+class ProductBatchRequest(BaseModel):
+    ids: List[str]
+
+class ProductBatchResults(BaseModel):
+    products: Dict[str, Optional[Product]]  # null marks an id that was not found
+    not_found: List[str]
+
+class OrderBulkStatusUpdate(BaseModel):
+    order_ids: List[str]
+    status: Literal["pending", "confirmed", "shipped", "delivered", "cancelled"]
+
 # Email configuration
 EMAIL_USER = os.environ.get('EMAIL_USER')
 EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD')
+EMAIL_SMTP_HOST = os.environ.get('EMAIL_SMTP_HOST', 'smtp.gmail.com')
+EMAIL_SMTP_PORT = os.environ.get('EMAIL_SMTP_PORT')  # Defaults to 465 with SSL, 587 otherwise
+EMAIL_SMTP_SSL = os.environ.get('EMAIL_SMTP_SSL', 'true').lower() == 'true'
+EMAIL_SMTP_STARTTLS = os.environ.get('EMAIL_SMTP_STARTTLS')  # 'true'/'false', unset lets yagmail decide
+
+# Email outbox: emails are queued in Mongo and sent by background workers
+EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', '2'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+EMAIL_OUTBOX_BACKOFF_SECONDS = float(os.environ.get('EMAIL_OUTBOX_BACKOFF_SECONDS', '30'))
+EMAIL_OUTBOX_MAX_BACKOFF_SECONDS = float(os.environ.get('EMAIL_OUTBOX_MAX_BACKOFF_SECONDS', '3600'))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', '5'))
+EMAIL_OUTBOX_LEASE_SECONDS = float(os.environ.get('EMAIL_OUTBOX_LEASE_SECONDS', '300'))
 
 # Email helper functions
-def send_order_confirmation_email(customer_email: str, customer_name: str, order_data: dict):
-    """Send order confirmation email to customer"""
-    try:
-        yag = yagmail.SMTP(EMAIL_USER, EMAIL_PASSWORD)
-        
-        subject = f"Order Confirmation - Saahaz.com (Order #{order_data['id'][:8]})"
-        
-        body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="text-align: center; margin-bottom: 30px;">
-                    <h1 style="color: #f97316; margin-bottom: 5px;">SAAHAZ</h1>
-                    <p style="color: #666; margin: 0;">Premium Fashion</p>
-                </div>
-                
-                <h2 style="color: #f97316;">Order Confirmation</h2>
-                <p>Dear {customer_name},</p>
-                <p>Thank you for your order! We're excited to get your items to you.</p>
-                
-                <div style="background: #f9fafb; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #333; margin-top: 0;">Order Details</h3>
-                    <p><strong>Order ID:</strong> #{order_data['id'][:8]}</p>
-                    <p><strong>Order Date:</strong> {order_data.get('created_at', 'N/A')}</p>
-                    <p><strong>Payment Method:</strong> Cash on Delivery (COD)</p>
-                    <p><strong>Delivery Address:</strong><br>{order_data.get('delivery_address', 'N/A')}</p>
-                </div>
-                
-                <div style="background: #fff; border: 1px solid #e5e7eb; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #333; margin-top: 0;">Items Ordered</h3>
-                    {_format_order_items(order_data.get('items', []))}
-                </div>
-                
-                <div style="background: #f97316; color: white; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="margin-top: 0; color: white;">Order Summary</h3>
-                    <p style="margin: 5px 0;"><strong>Subtotal: PKR {order_data.get('subtotal', 0):,.0f}</strong></p>
-                    <p style="margin: 5px 0;"><strong>Delivery: PKR {order_data.get('delivery_charge', 0):,.0f}</strong></p>
-                    <p style="margin: 5px 0; font-size: 18px;"><strong>Total: PKR {order_data.get('total_amount', 0):,.0f}</strong></p>
-                </div>
-                
-                <p>We'll start processing your order right away and will send you another email when your order ships.</p>
-                <p>For any questions, reply to this email or contact us at Saahazstore@gmail.com</p>
-                
-                <div style="text-align: center; margin-top: 40px; padding-top: 20px; border-top: 1px solid #e5e7eb;">
-                    <p style="color: #666; font-size: 14px;">
-                        © 2025 Saahaz.com - Premium Fashion<br>
-                        Karachi, Pakistan
-                    </p>
-                </div>
+def build_order_confirmation_email(customer_name: str, order_data: dict):
+    """Build subject and HTML body of the order confirmation email"""
+    subject = f"Order Confirmation - Saahaz.com (Order #{order_data['id'][:8]})"
+    
+    body = f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="text-align: center; margin-bottom: 30px;">
+                <h1 style="color: #f97316; margin-bottom: 5px;">SAAHAZ</h1>
+                <p style="color: #666; margin: 0;">Premium Fashion</p>
             </div>
-        </body>
-        </html>
-        """
-        
-        yag.send(to=customer_email, subject=subject, contents=body)
-        print(f"✅ Order confirmation email sent to {customer_email}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to send email to {customer_email}: {str(e)}")
-        return False
+            
+            <h2 style="color: #f97316;">Order Confirmation</h2>
+            <p>Dear {customer_name},</p>
+            <p>Thank you for your order! We're excited to get your items to you.</p>
+            
+            <div style="background: #f9fafb; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <h3 style="color: #333; margin-top: 0;">Order Details</h3>
+                <p><strong>Order ID:</strong> #{order_data['id'][:8]}</p>
+                <p><strong>Order Date:</strong> {order_data.get('created_at', 'N/A')}</p>
+                <p><strong>Payment Method:</strong> Cash on Delivery (COD)</p>
+                <p><strong>Delivery Address:</strong><br>{order_data.get('delivery_address', 'N/A')}</p>
+            </div>
+            
+            <div style="background: #fff; border: 1px solid #e5e7eb; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <h3 style="color: #333; margin-top: 0;">Items Ordered</h3>
+                {_format_order_items(order_data.get('items', []))}
+            </div>
+            
+            <div style="background: #f97316; color: white; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <h3 style="margin-top: 0; color: white;">Order Summary</h3>
+                <p style="margin: 5px 0;"><strong>Subtotal: PKR {order_data.get('subtotal', 0):,.0f}</strong></p>
+                <p style="margin: 5px 0;"><strong>Delivery: PKR {order_data.get('delivery_charge', 0):,.0f}</strong></p>
+                <p style="margin: 5px 0; font-size: 18px;"><strong>Total: PKR {order_data.get('total_amount', 0):,.0f}</strong></p>
+            </div>
+            
+            <p>We'll start processing your order right away and will send you another email when your order ships.</p>
+            <p>For any questions, reply to this email or contact us at Saahazstore@gmail.com</p>
+            
+            <div style="text-align: center; margin-top: 40px; padding-top: 20px; border-top: 1px solid #e5e7eb;">
+                <p style="color: #666; font-size: 14px;">
+                    © 2025 Saahaz.com - Premium Fashion<br>
+                    Karachi, Pakistan
+                </p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    return subject, body
 
-def send_order_status_update_email(customer_email: str, customer_name: str, order_data: dict, new_status: str):
-    """Send order status update email to customer"""
-    try:
-        yag = yagmail.SMTP(EMAIL_USER, EMAIL_PASSWORD)
-        
-        status_messages = {
-            'confirmed': 'Your order has been confirmed and is being prepared.',
-            'shipped': 'Great news! Your order has been shipped and is on its way.',
-            'delivered': 'Your order has been delivered. Thank you for shopping with Saahaz!',
-            'cancelled': 'Your order has been cancelled. If you have questions, please contact us.'
-        }
-        
-        subject = f"Order Update - Saahaz.com (Order #{order_data['id'][:8]}) - {new_status.title()}"
-        
-        body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="text-align: center; margin-bottom: 30px;">
-                    <h1 style="color: #f97316; margin-bottom: 5px;">SAAHAZ</h1>
-                    <p style="color: #666; margin: 0;">Premium Fashion</p>
-                </div>
-                
-                <h2 style="color: #f97316;">Order Status Update</h2>
-                <p>Dear {customer_name},</p>
-                <p>{status_messages.get(new_status, f'Your order status has been updated to {new_status}.')}</p>
-                
-                <div style="background: #f9fafb; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #333; margin-top: 0;">Order Information</h3>
-                    <p><strong>Order ID:</strong> #{order_data['id'][:8]}</p>
-                    <p><strong>Status:</strong> <span style="color: #f97316; font-weight: bold;">{new_status.title()}</span></p>
-                    <p><strong>Total Amount:</strong> PKR {order_data.get('total_amount', 0):,.0f}</p>
-                </div>
-                
-                <p>For any questions about your order, please contact us at Saahazstore@gmail.com</p>
-                
-                <div style="text-align: center; margin-top: 40px; padding-top: 20px; border-top: 1px solid #e5e7eb;">
-                    <p style="color: #666; font-size: 14px;">
-                        © 2025 Saahaz.com - Premium Fashion<br>
-                        Karachi, Pakistan
-                    </p>
-                </div>
+def build_order_status_update_email(customer_name: str, order_data: dict, new_status: str):
+    """Build subject and HTML body of the order status update email"""
+    status_messages = {
+        'confirmed': 'Your order has been confirmed and is being prepared.',
+        'shipped': 'Great news! Your order has been shipped and is on its way.',
+        'delivered': 'Your order has been delivered. Thank you for shopping with Saahaz!',
+        'cancelled': 'Your order has been cancelled. If you have questions, please contact us.'
+    }
+    
+    subject = f"Order Update - Saahaz.com (Order #{order_data['id'][:8]}) - {new_status.title()}"
+    
+    body = f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="text-align: center; margin-bottom: 30px;">
+                <h1 style="color: #f97316; margin-bottom: 5px;">SAAHAZ</h1>
+                <p style="color: #666; margin: 0;">Premium Fashion</p>
             </div>
-        </body>
-        </html>
-        """
-        
-        yag.send(to=customer_email, subject=subject, contents=body)
-        print(f"✅ Order status update email sent to {customer_email}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to send status update email to {customer_email}: {str(e)}")
-        return False
+            
+            <h2 style="color: #f97316;">Order Status Update</h2>
+            <p>Dear {customer_name},</p>
+            <p>{status_messages.get(new_status, f'Your order status has been updated to {new_status}.')}</p>
+            
+            <div style="background: #f9fafb; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <h3 style="color: #333; margin-top: 0;">Order Information</h3>
+                <p><strong>Order ID:</strong> #{order_data['id'][:8]}</p>
+                <p><strong>Status:</strong> <span style="color: #f97316; font-weight: bold;">{new_status.title()}</span></p>
+                <p><strong>Total Amount:</strong> PKR {order_data.get('total_amount', 0):,.0f}</p>
+            </div>
+            
+            <p>For any questions about your order, please contact us at Saahazstore@gmail.com</p>
+            
+            <div style="text-align: center; margin-top: 40px; padding-top: 20px; border-top: 1px solid #e5e7eb;">
+                <p style="color: #666; font-size: 14px;">
+                    © 2025 Saahaz.com - Premium Fashion<br>
+                    Karachi, Pakistan
+                </p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    return subject, body
 
 def _format_order_items(items: list) -> str:
     """Helper function to format order items for email"""
@@ -287,33 +942,422 @@ def _format_order_items(items: list) -> str:
         </div>
         """
     return items_html
+
+# Email outbox
+class OutboxMailer:
+    """SMTP connection owned by one outbox worker and reused across sends"""
+
+    def __init__(self):
+        self.yag = None
+        self.connected = False
+
+    def _connect(self):
+        if self.yag is None:
+            starttls = None if EMAIL_SMTP_STARTTLS is None else EMAIL_SMTP_STARTTLS.lower() == 'true'
+            self.yag = yagmail.SMTP(
+                EMAIL_USER,
+                EMAIL_PASSWORD,
+                host=EMAIL_SMTP_HOST,
+                port=EMAIL_SMTP_PORT,
+                smtp_ssl=EMAIL_SMTP_SSL,
+                smtp_starttls=starttls,
+                smtp_skip_login=not EMAIL_PASSWORD
+            )
+        self.yag.login()
+        self.connected = True
+
+    def send(self, to: str, subject: str, contents: str):
+        """Blocking send; runs in a worker thread"""
+        if not self.connected:
+            self._connect()
+        recipients, message = self.yag.prepare_send(to, subject, contents)
+        try:
+            self.yag.smtp.sendmail(self.yag.user, recipients, message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle connection; reconnect once and retry
+            self._connect()
+            self.yag.smtp.sendmail(self.yag.user, recipients, message)
+
+    def close(self):
+        if self.yag is not None and self.connected:
+            self.yag.close()
+        self.connected = False
+
+_outbox_wakeup = asyncio.Event()
+_outbox_workers: List[asyncio.Task] = []
+
+def _outbox_document(to: str, subject: str, contents: str, now: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "to": to,
+        "subject": subject,
+        "contents": contents,
+        "status": "pending",  # pending, sending, sent, dead
+        "attempts": 0,
+        "next_attempt_at": now,
+        "locked_until": None,
+        "last_error": None,
+        "created_at": now,
+        "sent_at": None,
+        "trace": current_trace()  # the delivery span joins the trace of the request that queued it
+    }
+
+async def queue_email(to: str, subject: str, contents: str):
+    """Store an email in the outbox; it is sent by the background workers"""
+    await db[email_outbox_collection].insert_one(_outbox_document(to, subject, contents, datetime.now(timezone.utc)))
+    _outbox_wakeup.set()
+
+async def queue_emails(messages: List[tuple]):
+    """Store several (to, subject, contents) emails in the outbox with one insert"""
+    if not messages:
+        return
+    now = datetime.now(timezone.utc)
+    await db[email_outbox_collection].insert_many([_outbox_document(*message, now) for message in messages])
+    _outbox_wakeup.set()
+
+async def _claim_outbox_email():
+    now = datetime.now(timezone.utc)
+    # Emails stuck in "sending" past their lease belong to a worker that died
+    return await db[email_outbox_collection].find_one_and_update(
+        {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "locked_until": {"$lte": now}}
+        ]},
+        {"$set": {"status": "sending", "locked_until": now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS)}},
+        sort=[("next_attempt_at", 1)]
+    )
+
+async def _deliver_outbox_email(mailer: OutboxMailer, email: dict):
+    try:
+        with root_span("email.send", "client", email.get("trace"), **{"email.attempt": email["attempts"] + 1}):
+            await asyncio.to_thread(mailer.send, email["to"], email["subject"], email["contents"])
+    except Exception as e:
+        mailer.close()
+        attempts = email["attempts"] + 1
+        if attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+            update = {"status": "dead", "attempts": attempts, "last_error": str(e), "locked_until": None}
+            print(f"❌ Giving up on email to {email['to']} after {attempts} attempts: {str(e)}")
+        else:
+            delay = min(EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), EMAIL_OUTBOX_MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(0.8, 1.2)
+            update = {
+                "status": "pending",
+                "attempts": attempts,
+                "last_error": str(e),
+                "locked_until": None,
+                "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay)
+            }
+            print(f"⚠️ Failed to send email to {email['to']} (attempt {attempts}), retrying in {delay:.0f}s: {str(e)}")
+        await db[email_outbox_collection].update_one({"id": email["id"]}, {"$set": update})
+        return
+
+    await db[email_outbox_collection].update_one(
+        {"id": email["id"]},
+        {"$set": {"status": "sent", "attempts": email["attempts"] + 1, "locked_until": None, "sent_at": datetime.now(timezone.utc)}}
+    )
+    print(f"✅ Email sent to {email['to']}: {email['subject']}")
+
+async def _outbox_worker():
+    mailer = OutboxMailer()
+    try:
+        while True:
+            try:
+                email = await _claim_outbox_email()
+            except Exception as e:
+                print(f"❌ Email outbox query failed: {str(e)}")
+                email = None
+            if email is not None:
+                try:
+                    await _deliver_outbox_email(mailer, email)
+                except Exception as e:
+                    # Recording the outcome failed; the lease stays and the email is retried once it expires
+                    print(f"❌ Email outbox update failed for {email['id']}: {str(e)}")
+                continue
+            
+            # Nothing due: keep the connection only while there is work, then wait
+            mailer.close()
+            _outbox_wakeup.clear()
+            try:
+                await asyncio.wait_for(_outbox_wakeup.wait(), timeout=EMAIL_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        mailer.close()
+
+def start_email_outbox_workers():
+    for _ in range(EMAIL_OUTBOX_WORKERS):
+        _outbox_workers.append(asyncio.create_task(_outbox_worker()))
+
+async def stop_email_outbox_workers():
+    for task in _outbox_workers:
+        task.cancel()
+    await asyncio.gather(*_outbox_workers, return_exceptions=True)
+    _outbox_workers.clear()
+
+# Authenticated user cache
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+
+class UserCache:
+    """Bounded TTL/LRU cache of resolved User objects keyed by user id.
+    
+    Cached users are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str) -> Optional[User]:
+        user = self._users.get(user_id)
+        if user is not None:
+            self.hits += 1
+            return user
+        
+        self.misses += 1
+        generation = self._generation
+        user_doc = await db[users_collection].find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+        if user_doc is None:
+            return None
+        user = User(**user_doc)
+        # Skip caching if the user was invalidated while we were reading it
+        if generation == self._generation:
+            self._users[user_id] = user
+        return user
+
+    def invalidate(self, user_id: str):
+        self._generation += 1
+        self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._users),
+            "maxsize": self._users.maxsize,
+            "ttl_seconds": self._users.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-def create_access_token(data: dict):
-    return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
+def verify_and_upgrade_password(plain_password: str, hashed_password: str):
+    """Verify a password and rehash it if the stored hash uses outdated settings"""
+    if not hashed_password or not verify_password(plain_password, hashed_password):
+        return False, None
+    if pwd_context.needs_update(hashed_password):
+        return True, get_password_hash(plain_password)
+    return True, None
+
+# bcrypt runs in its own thread pool so logins never stall the event loop;
+# when too many jobs are waiting, new ones are shed with a 503
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_password_jobs_pending = 0
+
+async def run_password_job(func, *args):
+    global _password_jobs_pending
+    if _password_jobs_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"}
+        )
+    _password_jobs_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        _password_jobs_pending -= 1
+
+# Token revocation
+REVOCATION_BLOOM_BITS = int(os.environ.get('REVOCATION_BLOOM_BITS', str(1 << 20)))
+REVOCATION_BLOOM_HASHES = int(os.environ.get('REVOCATION_BLOOM_HASHES', '7'))
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', '5'))
+
+class BloomFilter:
+    """Fixed-size Bloom filter: a miss means definitely absent, a hit only maybe present"""
+
+    def __init__(self, bits: int, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class TokenRevocationList:
+    """Revoked token ids and per-user access token cutoffs, held in memory.
+    
+    Revocations are written to Mongo and pulled by every worker in the
+    background, so checking a token never needs a database round trip.
+    """
+
+    def __init__(self):
+        self.revoked: Dict[str, float] = {}  # jti -> token expiry timestamp
+        self.user_cutoffs: Dict[str, tuple] = {}  # user_id -> (cutoff, expiry) timestamps
+        self.bloom = BloomFilter(REVOCATION_BLOOM_BITS, REVOCATION_BLOOM_HASHES)
+        self.synced_until: Optional[datetime] = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get("jti")
+        if jti and jti in self.bloom and jti in self.revoked:
+            return True
+        if payload.get("type") == "access" and self.user_cutoffs:
+            cutoff = self.user_cutoffs.get(payload.get("sub"))
+            # Both are sub-second, so a token issued in the cutoff's own second is caught too
+            if cutoff is not None and payload.get("iat", 0) <= cutoff[0]:
+                return True
+        return False
+
+    def _apply(self, entry: dict):
+        expires = entry["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+        if entry.get("jti"):
+            self.revoked[entry["jti"]] = expires
+            self.bloom.add(entry["jti"])
+        else:
+            self.user_cutoffs[entry["user_id"]] = (entry["not_before"], expires)
 
+    async def _record(self, entry: dict):
+        self._apply(entry)
+        await db[revoked_tokens_collection].insert_one({**entry, "revoked_at": datetime.now(timezone.utc)})
+
+    async def revoke_token(self, payload: dict):
+        await self._record({
+            "jti": payload["jti"],
+            "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc)
+        })
+
+    async def revoke_user_access_tokens(self, user_id: str):
+        """Invalidate every access token the user holds; refresh tokens keep working"""
+        now = datetime.now(timezone.utc)
+        await self._record({
+            "user_id": user_id,
+            "not_before": now.timestamp(),
+            "expires_at": now + timedelta(minutes=ACCESS_TOKEN_TTL_MINUTES)
+        })
+
+    def _prune(self):
+        now = time.time()
+        expired = [jti for jti, expires in self.revoked.items() if expires < now]
+        for jti in expired:
+            del self.revoked[jti]
+        for user_id in [u for u, (_, expires) in self.user_cutoffs.items() if expires < now]:
+            del self.user_cutoffs[user_id]
+        if expired:
+            # Bloom filters cannot forget, so rebuild from what is left
+            self.bloom = BloomFilter(REVOCATION_BLOOM_BITS, REVOCATION_BLOOM_HASHES)
+            for jti in self.revoked:
+                self.bloom.add(jti)
+
+    async def sync(self):
+        """Pull revocations made by other workers since the last sync"""
+        query = {}
+        if self.synced_until is not None:
+            # Overlap a little so writes that landed out of order are not missed
+            query["revoked_at"] = {"$gte": self.synced_until - timedelta(seconds=REVOCATION_SYNC_SECONDS)}
+        started = datetime.now(timezone.utc)
+        async for entry in db[revoked_tokens_collection].find(query, {"_id": 0}):
+            self._apply(entry)
+        self.synced_until = started
+        self._prune()
+
+token_revocations = TokenRevocationList()
+_revocation_sync_task: Optional[asyncio.Task] = None
+
+async def _revocation_sync_loop():
+    while True:
+        try:
+            await token_revocations.sync()
+        except Exception as e:
+            print(f"❌ Token revocation sync failed: {str(e)}")
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    now = datetime.now(timezone.utc)
+    claims = {
+        "type": "access",
+        "jti": uuid.uuid4().hex,
+        "iat": now.timestamp(),  # sub-second, for the per-user revocation cutoffs
+        "exp": now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_TTL_MINUTES)),
+        **data
+    }
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+def create_refresh_token(user_id: str):
+    return create_access_token(
+        {"sub": user_id, "type": "refresh"},
+        expires_delta=timedelta(days=REFRESH_TOKEN_TTL_DAYS)
+    )
+
+def issue_tokens(user_id: str, is_admin: bool) -> dict:
+    """Access token carrying the role claim, plus a refresh token"""
+    return {
+        "access_token": create_access_token({"sub": user_id, "admin": is_admin}),
+        "refresh_token": create_refresh_token(user_id),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_TTL_MINUTES * 60
+    }
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    """Verify signature, expiry, type and revocation; raises a JWT error otherwise"""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp", "sub", "jti"]})
+    if payload.get("type") != token_type:
+        raise jwt.InvalidTokenError(f"Expected a {token_type} token")
+    if token_revocations.is_revoked(payload):
+        raise jwt.InvalidTokenError("Token has been revoked")
+    return payload
+
+@traced("auth.get_token_claims")
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenClaims:
+    """Identity and role straight from the access token, without touching the database"""
+    try:
+        payload = decode_token(credentials.credentials)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return TokenClaims(user_id=payload["sub"], is_admin=payload.get("admin", False))
+
+async def require_admin(claims: TokenClaims = Depends(get_token_claims)) -> TokenClaims:
+    if not claims.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return claims
+
+@traced("auth.get_current_user")
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user_doc = await db[users_collection].find_one({"id": user_id})
-        if user_doc is None:
+        user = await user_cache.get(user_id)
+        if user is None:
             raise HTTPException(status_code=401, detail="User not found")
-        
-        # Create user object (without password_hash and _id)
-        user_response = {k: v for k, v in user_doc.items() if k not in ['password_hash', '_id']}
-        return User(**user_response)
+        return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+@traced("auth.get_current_user_optional")
 async def get_current_user_optional(authorization: str = Header(None)):
     """Get current user if authenticated, otherwise return None for guest orders"""
     if not authorization:
@@ -324,21 +1368,298 @@ async def get_current_user_optional(authorization: str = Header(None)):
         
     try:
         token = authorization.replace("Bearer ", "")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             return None
         
-        user_doc = await db[users_collection].find_one({"id": user_id})
-        if user_doc is None:
-            return None
-        
-        # Create user object (without password_hash and _id)
-        user_response = {k: v for k, v in user_doc.items() if k not in ['password_hash', '_id']}
-        return User(**user_response)
+        return await user_cache.get(user_id)
     except JWTError:
         return None
 
+# Product search index
+SEARCH_FIELD_WEIGHTS = {"name": 3.0, "colors": 2.0, "sizes": 1.5, "description": 1.0}
+SEARCH_INDEX_REFRESH_SECONDS = int(os.environ.get('SEARCH_INDEX_REFRESH_SECONDS', '300'))
+_search_token_re = re.compile(r"[a-z0-9]+")
+
+def _tokenize(text: str) -> List[str]:
+    return _search_token_re.findall(text.lower())
+
+class ProductSearchIndex:
+    """In-memory inverted index over product name, description, colors and sizes"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, float]] = {}  # token -> {product_id: weight}
+        self.terms: List[str] = []  # sorted vocabulary, used for prefix matching
+        self.doc_terms: Dict[str, Set[str]] = {}
+        self.loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _weighted_terms(product: dict) -> Dict[str, float]:
+        weights: Dict[str, float] = {}
+        for field, field_weight in SEARCH_FIELD_WEIGHTS.items():
+            value = product.get(field) or ""
+            if isinstance(value, list):
+                value = " ".join(value)
+            for token in _tokenize(value):
+                weights[token] = weights.get(token, 0) + field_weight
+        return weights
+
+    def add(self, product: dict):
+        product_id = product["id"]
+        self.remove(product_id)
+        weights = self._weighted_terms(product)
+        for token, weight in weights.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                bisect.insort(self.terms, token)
+            postings[product_id] = weight
+        self.doc_terms[product_id] = set(weights)
+
+    def remove(self, product_id: str):
+        for token in self.doc_terms.pop(product_id, ()):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self.postings[token]
+                self.terms.pop(bisect.bisect_left(self.terms, token))
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.terms, prefix)
+        matches = []
+        for term in self.terms[start:]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query: str) -> List[str]:
+        """Return product ids matching every query token, best match first"""
+        tokens = _tokenize(query)
+        if not tokens:
+            return []
+
+        doc_count = max(len(self.doc_terms), 1)
+        scores: Optional[Dict[str, float]] = None
+        for position, token in enumerate(tokens):
+            # The last token is matched as a prefix so results follow the user while typing
+            if position == len(tokens) - 1:
+                candidates = self._prefix_terms(token)
+            else:
+                candidates = [token] if token in self.postings else []
+
+            token_scores: Dict[str, float] = {}
+            for term in candidates:
+                postings = self.postings[term]
+                idf = math.log(1 + doc_count / len(postings))
+                boost = 1.0 if term == token else 0.5
+                for product_id, weight in postings.items():
+                    token_scores[product_id] = token_scores.get(product_id, 0) + weight * idf * boost
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores}
+            if not scores:
+                return []
+
+        return sorted(scores, key=lambda pid: (-scores[pid], pid))
+
+    async def ensure_loaded(self):
+        """Build the index from the products collection on first use and refresh it periodically"""
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < SEARCH_INDEX_REFRESH_SECONDS:
+            return
+        async with self._lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < SEARCH_INDEX_REFRESH_SECONDS:
+                return
+            projection = {"_id": 0, "id": 1, **{field: 1 for field in SEARCH_FIELD_WEIGHTS}}
+            self.postings, self.terms, self.doc_terms = {}, [], {}
+            async for product in db[products_collection].find({}, projection):
+                self.add(product)
+            self.loaded_at = time.monotonic()
+
+    def on_product_saved(self, product: dict):
+        # Writes before the first load are picked up by the initial build
+        if self.loaded_at is not None:
+            self.add(product)
+
+    def on_product_deleted(self, product_id: str):
+        if self.loaded_at is not None:
+            self.remove(product_id)
+
+product_search_index = ProductSearchIndex()
+
+# Fast serialization
+# Encode list responses straight from Mongo documents with orjson instead of
+# building a model per document and validating it again against response_model.
+# The output matches the model path: numbers are coerced to the field's type
+# (Mongo may hold 2500 for a float price) and UTC datetimes end in "Z".
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'false').lower() == 'true'
+FAST_JSON_OPTIONS = orjson.OPT_UTC_Z
+
+def model_projection(model) -> dict:
+    """Mongo projection returning only the fields a response model publishes"""
+    projection = {name: 1 for name in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+def _nested_model(annotation):
+    """The model inside a List[Model] annotation, if any"""
+    for arg in get_args(annotation):
+        if isinstance(arg, type) and issubclass(arg, BaseModel):
+            return arg
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _field_plan(model) -> tuple:
+    """(name, field, nested model, numeric type) for each field of a model"""
+    plan = []
+    for name, field in model.model_fields.items():
+        types = (field.annotation, *get_args(field.annotation))
+        numeric = float if float in types else int if int in types else None
+        plan.append((name, field, _nested_model(field.annotation), numeric))
+    return tuple(plan)
+
+def fill_defaults(model, document: dict) -> dict:
+    """Add the defaults the model would have applied for missing fields and coerce numbers as it would"""
+    for name, field, nested, numeric in _field_plan(model):
+        if name not in document:
+            if not field.is_required():
+                document[name] = field.get_default(call_default_factory=True)
+            continue
+        value = document[name]
+        if numeric is float and type(value) is int:
+            document[name] = float(value)
+        elif numeric is int and type(value) is float and value.is_integer():
+            document[name] = int(value)
+        elif nested and isinstance(value, list):
+            for item in value:
+                fill_defaults(nested, item)
+    return document
+
+def serialize_documents(model, documents: list) -> list:
+    """Projected documents ready for encode_json, as models unless the fast path is on"""
+    if FAST_JSON_RESPONSES:
+        return [fill_defaults(model, document) for document in documents]
+    return [model(**document) for document in documents]
+
+def encode_json(content) -> bytes:
+    if FAST_JSON_RESPONSES:
+        return orjson.dumps(content, default=jsonable_encoder, option=FAST_JSON_OPTIONS)
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+# Catalog response cache
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', '1000'))
+# Bounds how stale inventory counts can get, since orders do not bump the version
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '30'))
+CATALOG_VERSION_SYNC_SECONDS = float(os.environ.get('CATALOG_VERSION_SYNC_SECONDS', '2'))
+
+class CatalogCache:
+    """Serialized catalog responses keyed by path and query, valid for one catalog version.
+    
+    Every product or category write bumps a version counter shared through Mongo;
+    other workers pick the new version up within CATALOG_VERSION_SYNC_SECONDS.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.entries = TTLCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL_SECONDS)
+
+    def get(self, key: str) -> Optional[tuple]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != self.version:
+            return None
+        return entry
+
+    def store(self, key: str, version: int, body: bytes, headers: dict) -> tuple:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        entry = (version, body, headers, etag)
+        # A write may have landed while the response was built
+        if version == self.version:
+            self.entries[key] = entry
+        return entry
+
+    def _advance(self, version: int):
+        if version > self.version:
+            self.version = version
+            self.entries.clear()
+
+    async def bump(self):
+        meta = await db[catalog_meta_collection].find_one_and_update(
+            {"_id": "catalog"}, {"$inc": {"version": 1}}, upsert=True, return_document=True
+        )
+        self._advance(meta["version"])
+
+    async def sync(self):
+        meta = await db[catalog_meta_collection].find_one({"_id": "catalog"})
+        if meta:
+            self._advance(meta["version"])
+
+catalog_cache = CatalogCache()
+_catalog_sync_task: Optional[asyncio.Task] = None
+
+async def _catalog_version_sync_loop():
+    while True:
+        try:
+            await catalog_cache.sync()
+        except Exception as e:
+            print(f"❌ Catalog version sync failed: {str(e)}")
+        await asyncio.sleep(CATALOG_VERSION_SYNC_SECONDS)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+async def catalog_response(request: Request, build) -> Response:
+    """Serve a catalog GET from the cache, answering 304 when the client's copy is current.
+    
+    build() returns the response content and any extra headers to cache with it.
+    """
+    key = request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    entry = catalog_cache.get(key)
+    if entry is None:
+        version = catalog_cache.version
+        content, headers = await build()
+        body = encode_json(content)
+        entry = catalog_cache.store(key, version, body, headers)
+    
+    _, body, headers, etag = entry
+    response_headers = {**headers, "ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=response_headers)
+    return Response(content=body, media_type="application/json", headers=response_headers)
+
+def encode_cursor(values: dict) -> str:
+    """Opaque pagination cursor for the last item of a page"""
+    payload = json.dumps(values, default=lambda v: v.isoformat(), separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, dict):
+            raise ValueError("cursor must encode an object")
+        return values
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(sort_key: str, value, last_id: str, ascending: bool) -> dict:
+    """Match documents that come after (value, last_id) in (sort_key, id) order"""
+    op = "$gt" if ascending else "$lt"
+    if value is None:
+        # Missing values sort first ascending and last descending
+        after_nulls = [{sort_key: {"$ne": None}}] if ascending else []
+        return {"$or": [{sort_key: None, "id": {op: last_id}}] + after_nulls}
+    before_value = [] if ascending else [{sort_key: None}]
+    return {"$or": [{sort_key: {op: value}}, {sort_key: value, "id": {op: last_id}}] + before_value}
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -353,7 +1674,7 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password and create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await run_password_job(get_password_hash, user_data.password)
     user_dict = user_data.dict()
     user_dict.pop('password')
     
@@ -361,11 +1682,14 @@ async def register(user_data: UserCreate):
     user_doc = user.dict()
     user_doc['password_hash'] = hashed_password
     
-    await db[users_collection].insert_one(user_doc)
+    try:
+        await db[users_collection].insert_one(user_doc)
+    except DuplicateKeyError:
+        # A concurrent registration won the unique email index
+        raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Create token
-    token = create_access_token({"sub": user.id})
-    return {"access_token": token, "token_type": "bearer", "user": user.dict()}
+    # Create tokens
+    return {**issue_tokens(user.id, user.is_admin), "user": user.dict()}
 
 @api_router.post("/auth/login", response_model=dict)
 async def login(user_data: UserLogin):
@@ -376,9 +1700,15 @@ async def login(user_data: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Check password
-    if not verify_password(user_data.password, user_doc.get('password_hash', '')):
+    valid, upgraded_hash = await run_password_job(
+        verify_and_upgrade_password, user_data.password, user_doc.get('password_hash', '')
+    )
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    if upgraded_hash:
+        await db[users_collection].update_one({"id": user_doc["id"]}, {"$set": {"password_hash": upgraded_hash}})
+    
     # Remove MongoDB _id and password_hash, keep only User model fields
     user_response = {k: v for k, v in user_doc.items() if k not in ['password_hash', '_id']}
     
@@ -388,29 +1718,45 @@ async def login(user_data: UserLogin):
     
     user_obj = User(**user_response)
     
-    token = create_access_token({"sub": user_obj.id})
-    return {"access_token": token, "token_type": "bearer", "user": user_obj.dict()}
+    # The role claim follows the stored flag, not the forced display value above
+    tokens = issue_tokens(user_obj.id, user_doc.get('is_admin', False))
+    return {**tokens, "user": user_obj.dict()}
+
+@api_router.post("/auth/refresh", response_model=dict)
+async def refresh_tokens(refresh_data: RefreshRequest):
+    """Exchange a refresh token for a new access/refresh token pair"""
+    try:
+        payload = decode_token(refresh_data.refresh_token, token_type="refresh")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    
+    # Re-read the user so role changes are picked up
+    user = await user_cache.get(payload["sub"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    # Refresh tokens are single use
+    await token_revocations.revoke_token(payload)
+    return issue_tokens(user.id, user.is_admin)
 
 # Category routes
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories():
-    categories = await db[categories_collection].find().to_list(1000)
-    return [Category(**{k: v for k, v in category.items() if k != '_id'}) for category in categories]
+async def get_categories(request: Request):
+    async def build():
+        categories = await db[categories_collection].find({}, model_projection(Category)).to_list(1000)
+        return serialize_documents(Category, categories), {}
+    
+    return await catalog_response(request, build)
 
 @api_router.post("/categories", response_model=Category)
-async def create_category(category_data: CategoryCreate, current_user: User = Depends(get_current_user)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def create_category(category_data: CategoryCreate, admin: TokenClaims = Depends(require_admin)):
     category = Category(**category_data.dict())
     await db[categories_collection].insert_one(category.dict())
+    await catalog_cache.bump()
     return category
 
 @api_router.put("/categories/{category_id}", response_model=Category)
-async def update_category(category_id: str, category_data: CategoryCreate, current_user: User = Depends(get_current_user)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def update_category(category_id: str, category_data: CategoryCreate, admin: TokenClaims = Depends(require_admin)):
     result = await db[categories_collection].update_one(
         {"id": category_id}, 
         {"$set": category_data.dict()}
@@ -419,53 +1765,131 @@ async def update_category(category_id: str, category_data: CategoryCreate, curre
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
     
+    await catalog_cache.bump()
     category = await db[categories_collection].find_one({"id": category_id})
     return Category(**{k: v for k, v in category.items() if k != '_id'})
 
 @api_router.delete("/categories/{category_id}")
-async def delete_category(category_id: str, current_user: User = Depends(get_current_user)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def delete_category(category_id: str, admin: TokenClaims = Depends(require_admin)):
     result = await db[categories_collection].delete_one({"id": category_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
     
+    await catalog_cache.bump()
     return {"message": "Category deleted successfully"}
 
 # Product routes
+PRODUCTS_PAGE_DEFAULT_LIMIT = 100
+PRODUCTS_PAGE_MAX_LIMIT = 500
+
 @api_router.get("/products", response_model=List[Product])
-async def get_products(category_id: Optional[str] = None, featured: Optional[bool] = None):
+async def get_products(
+    request: Request,
+    category_id: Optional[str] = None,
+    featured: Optional[bool] = None,
+    sort: Literal["created_at", "price", "name"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(PRODUCTS_PAGE_DEFAULT_LIMIT, ge=1, le=PRODUCTS_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None
+):
+    """List products sorted by sort/order, paginated by an opaque cursor.
+    
+    The next page cursor is returned in X-Next-Cursor and the number of products
+    matching the filters in X-Total-Count.
+    """
     filter_query = {}
     if category_id:
         filter_query["category_id"] = category_id
     if featured is not None:
         filter_query["featured"] = featured
     
-    products = await db[products_collection].find(filter_query).to_list(1000)
-    return [Product(**{k: v for k, v in product.items() if k != '_id'}) for product in products]
+    ascending = order == "asc"
+    if cursor:
+        position = decode_cursor(cursor)
+        if position.get("sort") != sort or position.get("order") != order or "id" not in position:
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+        value = position.get("value")
+        if sort == "created_at" and value is not None:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    async def build():
+        total = await db[products_collection].count_documents(filter_query)
+        page_query = dict(filter_query)
+        if cursor:
+            page_query.update(keyset_filter(sort, value, position["id"], ascending))
+        
+        direction = 1 if ascending else -1
+        query = db[products_collection].find(page_query, model_projection(Product)).sort([(sort, direction), ("id", direction)])
+        products = await query.limit(limit + 1).to_list(limit + 1)
+        
+        headers = {"X-Total-Count": str(total)}
+        if len(products) > limit:
+            products = products[:limit]
+            last = products[-1]
+            headers["X-Next-Cursor"] = encode_cursor(
+                {"sort": sort, "order": order, "value": last.get(sort), "id": last["id"]}
+            )
+        return serialize_documents(Product, products), headers
+    
+    return await catalog_response(request, build)
+
+@api_router.get("/products/search", response_model=ProductSearchResults)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    await product_search_index.ensure_loaded()
+    ranked_ids = product_search_index.search(q)
+    page_ids = ranked_ids[offset:offset + limit]
+
+    # Only the products on the requested page are fetched from the database
+    products_by_id = {}
+    if page_ids:
+        async for product in db[products_collection].find({"id": {"$in": page_ids}}, {"_id": 0}):
+            products_by_id[product["id"]] = product
+
+    results = [Product(**products_by_id[pid]) for pid in page_ids if pid in products_by_id]
+    return ProductSearchResults(query=q, total=len(ranked_ids), limit=limit, offset=offset, results=results)
+
+@api_router.post("/products/batch", response_model=ProductBatchResults)
+async def get_products_batch(batch: ProductBatchRequest):
+    """Look up many products in one query, keyed by id"""
+    ids = list(dict.fromkeys(batch.ids))
+    if len(ids) > PRODUCT_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {PRODUCT_BATCH_MAX_IDS} product ids per request")
+    
+    products: Dict[str, Optional[Product]] = {product_id: None for product_id in ids}
+    if ids:
+        async for product in db[products_collection].find({"id": {"$in": ids}}, {"_id": 0}):
+            products[product["id"]] = Product(**product)
+    
+    not_found = [product_id for product_id, product in products.items() if product is None]
+    return ProductBatchResults(products=products, not_found=not_found)
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db[products_collection].find_one({"id": product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**{k: v for k, v in product.items() if k != '_id'})
+async def get_product(product_id: str, request: Request):
+    async def build():
+        product = await db[products_collection].find_one({"id": product_id}, model_projection(Product))
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return serialize_documents(Product, [product])[0], {}
+    
+    return await catalog_response(request, build)
 
 @api_router.post("/products", response_model=Product)
-async def create_product(product_data: ProductCreate, current_user: User = Depends(get_current_user)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def create_product(product_data: ProductCreate, admin: TokenClaims = Depends(require_admin)):
     product = Product(**product_data.dict())
     await db[products_collection].insert_one(product.dict())
+    product_search_index.on_product_saved(product.dict())
+    await catalog_cache.bump()
     return product
 
 @api_router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, product_data: ProductCreate, current_user: User = Depends(get_current_user)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def update_product(product_id: str, product_data: ProductCreate, admin: TokenClaims = Depends(require_admin)):
     updated_product = product_data.dict()
     result = await db[products_collection].update_one(
         {"id": product_id}, 
@@ -476,35 +1900,475 @@ async def update_product(product_id: str, product_data: ProductCreate, current_u
         raise HTTPException(status_code=404, detail="Product not found")
     
     product = await db[products_collection].find_one({"id": product_id})
+    product_search_index.on_product_saved(product)
+    await catalog_cache.bump()
     return Product(**{k: v for k, v in product.items() if k != '_id'})
 
 @api_router.delete("/products/{product_id}")
-async def delete_product(product_id: str, current_user: User = Depends(get_current_user)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def delete_product(product_id: str, admin: TokenClaims = Depends(require_admin)):
     result = await db[products_collection].delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    product_search_index.on_product_deleted(product_id)
+    await catalog_cache.bump()
     return {"message": "Product deleted successfully"}
 
+# Product import and export
+PRODUCT_IMPORT_BATCH_SIZE = int(os.environ.get('PRODUCT_IMPORT_BATCH_SIZE', '500'))
+PRODUCT_IMPORT_MAX_REPORTED_ERRORS = int(os.environ.get('PRODUCT_IMPORT_MAX_REPORTED_ERRORS', '1000'))
+PRODUCT_EXPORT_BATCH_SIZE = int(os.environ.get('PRODUCT_EXPORT_BATCH_SIZE', '500'))
+PRODUCT_FILE_COLUMNS = ["id", "name", "description", "price", "category_id", "images", "sizes", "colors", "inventory", "featured"]
+PRODUCT_LIST_COLUMNS = ("images", "sizes", "colors")
+PRODUCT_LIST_SEPARATOR = "|"  # Separates list values inside a CSV cell
+
+async def iter_lines(chunks):
+    """Decode a stream of byte chunks into text lines, keeping line endings"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def _csv_rows(lines):
+    """(row, blank columns) per CSV row, keyed by the header row; quoted cells may span lines"""
+    header = None
+    record, quotes = [], 0
+    async for line in lines:
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue  # Inside a quoted cell, the record continues on the next line
+        for cells in csv.reader(record):
+            if header is None:
+                header = [cell.strip() for cell in cells]
+                unknown = set(header) - set(PRODUCT_FILE_COLUMNS)
+                if unknown:
+                    raise HTTPException(status_code=400, detail=f"Unknown CSV columns: {', '.join(sorted(unknown))}")
+            elif any(cell.strip() for cell in cells):
+                row, blank = {}, set()
+                for column, cell in zip(header, cells):
+                    if not cell.strip():
+                        blank.add(column)
+                    elif column in PRODUCT_LIST_COLUMNS:
+                        row[column] = [value.strip() for value in cell.split(PRODUCT_LIST_SEPARATOR) if value.strip()]
+                    else:
+                        row[column] = cell
+                yield row, blank
+        record, quotes = [], 0
+    if record:
+        yield {"__error__": "Unterminated quoted cell at end of file"}, set()
+
+async def _ndjson_rows(lines):
+    async for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {"__error__": f"Invalid JSON: {str(e)}"}
+        if not isinstance(row, dict):
+            row = {"__error__": "Each line must be a JSON object"}
+        yield row, set()
+
+class ProductImportRow(ProductCreate):
+    id: Optional[str] = None
+
+class ProductImportPatch(BaseModel):
+    """A row that only updates some columns of an existing product"""
+    id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    category_id: Optional[str] = None
+    images: Optional[List[str]] = None
+    sizes: Optional[List[str]] = None
+    colors: Optional[List[str]] = None
+    inventory: Optional[int] = None
+    featured: Optional[bool] = None
+
+PRODUCT_REQUIRED_COLUMNS = {name for name, field in ProductCreate.model_fields.items() if field.is_required()}
+
+def _product_write(row: dict, blank: Set[str] = frozenset()) -> tuple:
+    """Validate one import row into (product id, write, whether the product must already exist).
+    
+    Columns missing from the row, or blank in a CSV file, keep their stored
+    values. A row with an id but without every required column can only patch
+    an existing product.
+    """
+    if row.get("id") and not PRODUCT_REQUIRED_COLUMNS <= set(row):
+        fields = ProductImportPatch(**row).dict(exclude_unset=True)
+        product_id = fields.pop("id")
+        return product_id, UpdateOne({"id": product_id}, {"$set": fields}), True
+    
+    # Blank text cells are validated as empty strings but only written to new products
+    blank_text = {column: "" for column in blank if column in ("name", "description")}
+    fields = ProductImportRow(**{**blank_text, **row}).dict(exclude_unset=True)
+    product_id = fields.pop("id", None) or str(uuid.uuid4())
+    new_product = Product(**{**fields, "id": product_id}).dict()
+    for column in blank_text:
+        fields.pop(column)
+    on_insert = {k: v for k, v in new_product.items() if k not in fields}
+    return product_id, UpdateOne({"id": product_id}, {"$set": fields, "$setOnInsert": on_insert}, upsert=True), False
+
+async def import_products(lines, file_format: str, batch_size: int = PRODUCT_IMPORT_BATCH_SIZE,
+                          dry_run: bool = False) -> dict:
+    """Validate and upsert products from CSV or NDJSON lines, one bulk_write per batch.
+    
+    With dry_run the rows are only validated; patches of missing products are not detected.
+    """
+    report = {"rows": 0, "inserted": 0, "updated": 0, "error_count": 0, "errors": [], "dry_run": dry_run}
+
+    def record_error(row_number, product_id, detail):
+        report["error_count"] += 1
+        if len(report["errors"]) < PRODUCT_IMPORT_MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "id": product_id, "error": detail})
+
+    async def flush(batch):
+        patched_ids = [product_id for _, product_id, _, must_exist in batch if must_exist]
+        if patched_ids:
+            existing = set(await db[products_collection].distinct("id", {"id": {"$in": patched_ids}}))
+            for row_number, product_id, _, must_exist in batch:
+                if must_exist and product_id not in existing:
+                    record_error(row_number, product_id,
+                                 "Product not found; new products need " + ", ".join(sorted(PRODUCT_REQUIRED_COLUMNS)))
+            batch = [write for write in batch if not write[3] or write[1] in existing]
+        if not batch:
+            return
+        
+        rows, product_ids, operations, _ = zip(*batch)
+        try:
+            result = await db[products_collection].bulk_write(list(operations), ordered=False)
+            report["inserted"] += result.upserted_count
+            report["updated"] += result.matched_count
+        except BulkWriteError as e:
+            report["inserted"] += e.details.get("nUpserted", 0)
+            report["updated"] += e.details.get("nMatched", 0)
+            for write_error in e.details.get("writeErrors", []):
+                record_error(rows[write_error["index"]], product_ids[write_error["index"]], write_error.get("errmsg"))
+        
+        # Keep search results current without rebuilding the whole index
+        if product_search_index.loaded_at is not None:
+            projection = {"_id": 0, "id": 1, **{field: 1 for field in SEARCH_FIELD_WEIGHTS}}
+            async for product in db[products_collection].find({"id": {"$in": list(product_ids)}}, projection):
+                product_search_index.add(product)
+
+    rows = _csv_rows(lines) if file_format == "csv" else _ndjson_rows(lines)
+    batch = []
+    async for row, blank in rows:
+        report["rows"] += 1
+        row_number = report["rows"]
+        if "__error__" in row:
+            record_error(row_number, None, row["__error__"])
+            continue
+        try:
+            product_id, operation, must_exist = _product_write(row, blank)
+        except ValidationError as e:
+            problems = "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+            record_error(row_number, row.get("id"), problems)
+            continue
+        if not dry_run:
+            batch.append((row_number, product_id, operation, must_exist))
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+    if batch:
+        await flush(batch)
+    
+    if not dry_run and report["inserted"] + report["updated"]:
+        await catalog_cache.bump()
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
+
+async def export_products(file_format: str, batch_size: int = PRODUCT_EXPORT_BATCH_SIZE):
+    """Yield the catalog as CSV or NDJSON text, a cursor batch at a time"""
+    projection = {"_id": 0, **{column: 1 for column in PRODUCT_FILE_COLUMNS}}
+    cursor = db[products_collection].find({}, projection).sort("id", ASCENDING).batch_size(batch_size)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=PRODUCT_FILE_COLUMNS, extrasaction="ignore")
+    if file_format == "csv":
+        writer.writeheader()
+    
+    count = 0
+    async for product in cursor:
+        if file_format == "csv":
+            for column in PRODUCT_LIST_COLUMNS:
+                product[column] = PRODUCT_LIST_SEPARATOR.join(product.get(column) or [])
+            product["featured"] = "true" if product.get("featured") else "false"
+            writer.writerow(product)
+        else:
+            buffer.write(json.dumps(product) + "\n")
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+PRODUCT_FILE_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+@api_router.post("/admin/products/import")
+async def import_products_file(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    dry_run: bool = False,
+    batch_size: int = Query(PRODUCT_IMPORT_BATCH_SIZE, ge=1, le=5000),
+    admin: TokenClaims = Depends(require_admin)
+):
+    """Upsert products from a CSV or NDJSON request body, streamed in batches.
+    
+    The format defaults to csv for a text/csv body and ndjson otherwise. Rows
+    with an id update that product, rows without one create a new product.
+    """
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    return await import_products(iter_lines(request.stream()), format, batch_size, dry_run)
+
+@api_router.get("/admin/products/export")
+async def export_products_file(
+    format: Literal["csv", "ndjson"] = "csv",
+    admin: TokenClaims = Depends(require_admin)
+):
+    """Stream the whole catalog as CSV or NDJSON"""
+    return StreamingResponse(
+        export_products(format),
+        media_type=PRODUCT_FILE_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
+
 # Order routes
-@api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate, current_user: Optional[User] = Depends(get_current_user_optional)):
-    # Calculate subtotal from items
+async def price_order_items(items: List[CartItem]):
+    """Merge duplicate cart lines, validate them against the catalog and compute the subtotal.
+    
+    Also returns the sales lines (units and revenue per product) used for the sales rollups.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="Order must contain at least one item")
+    
+    # Lines for the same product, size and color are merged into one
+    merged: Dict[tuple, CartItem] = {}
+    for item in items:
+        if item.quantity < 1:
+            raise HTTPException(status_code=400, detail=f"Invalid quantity for product {item.product_id}")
+        key = (item.product_id, item.size, item.color)
+        if key in merged:
+            merged[key].quantity += item.quantity
+        else:
+            merged[key] = item.copy()
+    
+    product_ids = list({item.product_id for item in merged.values()})
+    projection = {"_id": 0, "id": 1, "price": 1, "category_id": 1, "inventory": 1, "sizes": 1, "colors": 1}
+    products = {}
+    async for product in db[products_collection].find({"id": {"$in": product_ids}}, projection):
+        products[product["id"]] = product
+    
     subtotal = 0
-    for item in order_data.items:
-        product = await db[products_collection].find_one({"id": item.product_id})
+    for item in merged.values():
+        product = products.get(item.product_id)
         if not product:
             raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
+        if item.size and product.get('sizes') and item.size not in product['sizes']:
+            raise HTTPException(status_code=400, detail=f"Size {item.size} is not available for product {item.product_id}")
+        if item.color and product.get('colors') and item.color not in product['colors']:
+            raise HTTPException(status_code=400, detail=f"Color {item.color} is not available for product {item.product_id}")
         subtotal += product['price'] * item.quantity
     
+    return list(merged.values()), subtotal, order_sales_lines([item.dict() for item in merged.values()], products)
+
+async def reserve_inventory(order_id: str, items: List[CartItem]):
+    """Atomically take stock for every product in the order, or none of it"""
+    quantities: Dict[str, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    
+    # Each decrement only applies while enough stock remains, so concurrent
+    # orders never drive inventory below zero and never wait on each other
+    if len(quantities) == 1:
+        product_id, quantity = next(iter(quantities.items()))
+        result = await db[products_collection].update_one(
+            {"id": product_id, "inventory": {"$gte": quantity}},
+            {"$inc": {"inventory": -quantity}}
+        )
+        if result.modified_count != 1:
+            raise HTTPException(status_code=409, detail=f"Insufficient stock for product {product_id}")
+        return
+    
+    # Multi-product orders tag each decremented product with the order id so a
+    # partial reservation can be undone exactly
+    operations = [
+        UpdateOne(
+            {"id": product_id, "inventory": {"$gte": quantity}},
+            {"$inc": {"inventory": -quantity}, "$push": {"pending_reservations": order_id}}
+        )
+        for product_id, quantity in quantities.items()
+    ]
+    try:
+        result = await db[products_collection].bulk_write(operations, ordered=False)
+        reserved = result.modified_count == len(operations)
+    except Exception:
+        await release_inventory(order_id, quantities)
+        raise
+    
+    if not reserved:
+        await release_inventory(order_id, quantities)
+        raise HTTPException(status_code=409, detail="Insufficient stock for one or more items")
+    
+    await db[products_collection].update_many(
+        {"id": {"$in": list(quantities)}},
+        {"$pull": {"pending_reservations": order_id}}
+    )
+
+async def release_inventory(order_id: str, quantities: Dict[str, int]):
+    """Return stock taken by a partially applied reservation"""
+    operations = [
+        UpdateOne(
+            {"id": product_id, "pending_reservations": order_id},
+            {"$inc": {"inventory": quantity}, "$pull": {"pending_reservations": order_id}}
+        )
+        for product_id, quantity in quantities.items()
+    ]
+    await db[products_collection].bulk_write(operations, ordered=False)
+
+async def restock_orders(orders: List[dict]):
+    """Give back the stock taken by orders that were cancelled or deleted"""
+    quantities: Dict[str, int] = {}
+    for order in orders:
+        for item in order.get("items", []):
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item.get("quantity", 1)
+    if quantities:
+        await db[products_collection].bulk_write(
+            [UpdateOne({"id": product_id}, {"$inc": {"inventory": quantity}}) for product_id, quantity in quantities.items()],
+            ordered=False
+        )
+
+# Sales rollups
+# One document per day x product x category x delivery option, kept current with
+# $inc as orders are placed, cancelled and deleted so reports never scan orders.
+# Each order stores the sales lines it contributed, so later adjustments undo
+# exactly what was added even if prices or categories change in between.
+SALES_ROLLUP_BATCH_SIZE = int(os.environ.get('SALES_ROLLUP_BATCH_SIZE', '500'))
+SALES_GROUP_KEYS = ("day", "product_id", "category_id", "delivery_option")
+
+def order_sales_lines(items: List[dict], products: Dict[str, dict]) -> List[dict]:
+    """Units and revenue per product for an order's items, at the given product prices"""
+    lines: Dict[str, dict] = {}
+    for item in items:
+        product = products.get(item["product_id"], {})
+        line = lines.setdefault(item["product_id"], {
+            "product_id": item["product_id"],
+            "category_id": product.get("category_id"),
+            "units": 0,
+            "revenue": 0.0
+        })
+        line["units"] += item["quantity"]
+        line["revenue"] += product.get("price", 0) * item["quantity"]
+    return list(lines.values())
+
+def sales_rollup_increments(order: dict, sign: int = 1) -> Dict[tuple, dict]:
+    """The $inc an order contributes to each rollup it touches; sign -1 removes it"""
+    day = order["created_at"].strftime("%Y-%m-%d")
+    delivery_option = order.get("delivery_option", "standard")
+    increments = {}
+    for line in order.get("sales_lines", []):
+        key = (day, line["product_id"], line["category_id"], delivery_option)
+        increments[key] = {"units": sign * line["units"], "revenue": sign * line["revenue"], "orders": sign}
+    return increments
+
+def _rollup_operations(increments: Dict[tuple, dict]) -> List[UpdateOne]:
+    return [
+        UpdateOne(dict(zip(SALES_GROUP_KEYS, key)), {"$inc": inc}, upsert=True)
+        for key, inc in increments.items()
+    ]
+
+def _merge_increments(orders: List[dict], sign: int) -> Dict[tuple, dict]:
+    # Orders of the same day and product share a rollup, so sum them before writing
+    increments: Dict[tuple, dict] = {}
+    for order in orders:
+        for key, inc in sales_rollup_increments(order, sign).items():
+            total = increments.setdefault(key, {"units": 0, "revenue": 0.0, "orders": 0})
+            for field, value in inc.items():
+                total[field] += value
+    return increments
+
+async def apply_sales_rollups(orders: List[dict], sign: int = 1):
+    """Add (sign 1) or remove (sign -1) the orders' sales from the rollups in one bulk_write"""
+    operations = _rollup_operations(_merge_increments(orders, sign))
+    if not operations:
+        return
+    try:
+        await db[sales_rollups_collection].bulk_write(operations, ordered=False)
+    except Exception as e:
+        # The orders themselves are fine; a backfill brings the rollups back in line
+        order_ids = ", ".join(order.get("id", "?") for order in orders)
+        print(f"❌ Sales rollup update failed for orders {order_ids}: {str(e)}")
+
+async def apply_sales_rollup(order: dict, sign: int = 1):
+    await apply_sales_rollups([order], sign)
+
+async def rebuild_sales_rollups(batch_size: int = SALES_ROLLUP_BATCH_SIZE) -> dict:
+    """Recompute all rollups from the orders collection, a batch of orders at a time.
+    
+    Orders placed before rollups existed get their sales lines priced from the
+    current catalog. Orders changing while the rebuild runs may be counted
+    wrongly, so run it when the shop is quiet.
+    """
+    await db[sales_rollups_collection].delete_many({})
+    orders_seen = 0
+    lines_priced = 0
+    last = None
+    while True:
+        query = {"status": {"$ne": "cancelled"}}
+        if last:
+            query.update(keyset_filter("created_at", last["created_at"], last["id"], ascending=True))
+        projection = {"_id": 0, "id": 1, "created_at": 1, "delivery_option": 1, "items": 1, "sales_lines": 1}
+        batch = await db[orders_collection].find(query, projection).sort(
+            [("created_at", ASCENDING), ("id", ASCENDING)]
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        
+        unpriced = [order for order in batch if "sales_lines" not in order]
+        if unpriced:
+            product_ids = list({item["product_id"] for order in unpriced for item in order.get("items", [])})
+            products = {}
+            async for product in db[products_collection].find(
+                {"id": {"$in": product_ids}}, {"_id": 0, "id": 1, "price": 1, "category_id": 1}
+            ):
+                products[product["id"]] = product
+            for order in unpriced:
+                order["sales_lines"] = order_sales_lines(order.get("items", []), products)
+            await db[orders_collection].bulk_write([
+                UpdateOne({"id": order["id"]}, {"$set": {"sales_lines": order["sales_lines"]}})
+                for order in unpriced
+            ], ordered=False)
+            lines_priced += len(unpriced)
+        
+        operations = _rollup_operations(_merge_increments(batch, 1))
+        if operations:
+            await db[sales_rollups_collection].bulk_write(operations, ordered=False)
+        
+        orders_seen += len(batch)
+        last = batch[-1]
+    
+    return {"orders": orders_seen, "orders_priced": lines_priced}
+
+@api_router.post("/orders", response_model=Order)
+async def create_order(order_data: OrderCreate, current_user: Optional[User] = Depends(get_current_user_optional)):
+    # Price and validate all items with a single query
+    items, subtotal, sales_lines = await price_order_items(order_data.items)
+    
     # Use provided values or calculate them
     delivery_charge = order_data.delivery_charge if order_data.delivery_charge is not None else 0
     total_amount = order_data.total if order_data.total else (subtotal + delivery_charge)
     
     order_dict = order_data.dict()
+    order_dict['items'] = [item.dict() for item in items]
     
     # Handle both authenticated and guest orders
     if current_user:
@@ -521,15 +2385,184 @@ async def create_order(order_data: OrderCreate, current_user: Optional[User] = D
         del order_dict['total']
     
     order = Order(**order_dict)
-    await db[orders_collection].insert_one(order.dict())
+    order_doc = {**order.dict(), "sales_lines": sales_lines}
+    await reserve_inventory(order.id, items)
+    try:
+        await db[orders_collection].insert_one(order_doc)
+    except Exception:
+        await db[products_collection].bulk_write(
+            [UpdateOne({"id": item.product_id}, {"$inc": {"inventory": item.quantity}}) for item in items],
+            ordered=False
+        )
+        raise
     
-    # Send order confirmation email
+    await apply_sales_rollup(order_doc)
+    
+    # Queue order confirmation email
     if order_data.customer_email:
         customer_name = order_data.customer_name or "Valued Customer"
-        send_order_confirmation_email(order_data.customer_email, customer_name, order.dict())
+        subject, body = build_order_confirmation_email(customer_name, order.dict())
+        await queue_email(order_data.customer_email, subject, body)
     
     return order
 
+# Session store
+SESSION_STORE = os.environ.get('SESSION_STORE', 'mongo')  # mongo or memory
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+# How long another worker may keep honouring a session after logout, with the memory store
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get('SESSION_CACHE_TTL_SECONDS', '30'))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.environ.get('SESSION_SWEEP_INTERVAL_SECONDS', '300'))
+SESSION_SWEEP_BATCH_SIZE = int(os.environ.get('SESSION_SWEEP_BATCH_SIZE', '500'))
+
+def _as_utc(value: datetime) -> datetime:
+    """Mongo returns naive UTC datetimes"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+class MongoSessionStore:
+    """Sessions in Mongo; a session and its user are resolved in one aggregation"""
+
+    async def create(self, session_doc: dict):
+        await db[sessions_collection].insert_one(session_doc)
+
+    async def resolve(self, session_token: str) -> Optional[User]:
+        pipeline = [
+            {"$match": {"session_token": session_token, "expires_at": {"$gt": datetime.now(timezone.utc)}}},
+            {"$limit": 1},
+            {"$lookup": {"from": users_collection, "localField": "user_id", "foreignField": "id", "as": "user"}},
+            {"$unwind": "$user"},
+            {"$project": {"_id": 0, "user": 1}},
+        ]
+        async for found in db[sessions_collection].aggregate(pipeline):
+            user_doc = found["user"]
+            return User(**{k: v for k, v in user_doc.items() if k not in ['password_hash', '_id']})
+        return None
+
+    async def delete(self, session_token: str):
+        await db[sessions_collection].delete_many({"session_token": session_token})
+
+    async def delete_expired(self, batch_size: int = SESSION_SWEEP_BATCH_SIZE) -> int:
+        """Delete expired sessions a batch at a time, so no single delete runs long"""
+        now = datetime.now(timezone.utc)
+        deleted = 0
+        while True:
+            expired = await db[sessions_collection].find(
+                {"expires_at": {"$lte": now}}, {"_id": 1}
+            ).limit(batch_size).to_list(batch_size)
+            if not expired:
+                return deleted
+            result = await db[sessions_collection].delete_many({"_id": {"$in": [doc["_id"] for doc in expired]}})
+            deleted += result.deleted_count
+            if len(expired) < batch_size:
+                return deleted
+
+class MemorySessionStore(MongoSessionStore):
+    """Write-through store serving hot sessions from process memory.
+    
+    Mongo stays the source of truth. Only the session (user id and expiry) is
+    kept here; the user comes from user_cache, so profile and role changes are
+    seen as soon as that cache is invalidated.
+    """
+
+    def __init__(self):
+        self.sessions = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL_SECONDS)
+
+    async def create(self, session_doc: dict):
+        await super().create(session_doc)
+        self.sessions[session_doc["session_token"]] = (session_doc["user_id"], _as_utc(session_doc["expires_at"]))
+
+    async def resolve(self, session_token: str) -> Optional[User]:
+        entry = self.sessions.get(session_token)
+        if entry is None:
+            session_doc = await db[sessions_collection].find_one(
+                {"session_token": session_token, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                {"_id": 0, "user_id": 1, "expires_at": 1}
+            )
+            if not session_doc:
+                return None
+            entry = (session_doc["user_id"], _as_utc(session_doc["expires_at"]))
+            self.sessions[session_token] = entry
+        
+        user_id, expires_at = entry
+        if expires_at <= datetime.now(timezone.utc):
+            self.sessions.pop(session_token, None)
+            return None
+        return await user_cache.get(user_id)
+
+    async def delete(self, session_token: str):
+        self.sessions.pop(session_token, None)
+        await super().delete(session_token)
+
+    async def delete_expired(self, batch_size: int = SESSION_SWEEP_BATCH_SIZE) -> int:
+        now = datetime.now(timezone.utc)
+        for session_token, (_, expires_at) in list(self.sessions.items()):
+            if expires_at <= now:
+                self.sessions.pop(session_token, None)
+        return await super().delete_expired(batch_size)
+
+SESSION_STORES = {"mongo": MongoSessionStore, "memory": MemorySessionStore}
+if SESSION_STORE not in SESSION_STORES:
+    raise RuntimeError(f"Unknown SESSION_STORE {SESSION_STORE!r}, expected one of: {', '.join(SESSION_STORES)}")
+session_store = SESSION_STORES[SESSION_STORE]()
+_session_sweep_task: Optional[asyncio.Task] = None
+
+async def _session_sweep_loop():
+    # The TTL index also removes expired sessions, but only about once a minute
+    # and never from process memory
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        try:
+            deleted = await session_store.delete_expired()
+            if deleted:
+                logger.info(f"Swept {deleted} expired sessions")
+        except Exception as e:
+            print(f"❌ Session sweep failed: {str(e)}")
+
+# Google session exchange
+GOOGLE_SESSION_DATA_URL = os.environ.get(
+    'GOOGLE_SESSION_DATA_URL', 'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data'
+)
+AUTH_PROVIDER_CONNECT_TIMEOUT = float(os.environ.get('AUTH_PROVIDER_CONNECT_TIMEOUT', '3'))
+AUTH_PROVIDER_READ_TIMEOUT = float(os.environ.get('AUTH_PROVIDER_READ_TIMEOUT', '10'))
+AUTH_PROVIDER_POOL_SIZE = int(os.environ.get('AUTH_PROVIDER_POOL_SIZE', '100'))
+AUTH_PROVIDER_DNS_TTL = int(os.environ.get('AUTH_PROVIDER_DNS_TTL', '300'))
+
+_auth_http_session: Optional[aiohttp.ClientSession] = None
+
+def get_auth_http_session() -> aiohttp.ClientSession:
+    """The application-wide client for the auth provider, keeping connections alive between logins"""
+    global _auth_http_session
+    if _auth_http_session is None or _auth_http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=AUTH_PROVIDER_POOL_SIZE,
+            ttl_dns_cache=AUTH_PROVIDER_DNS_TTL,
+            keepalive_timeout=60
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=AUTH_PROVIDER_CONNECT_TIMEOUT + AUTH_PROVIDER_READ_TIMEOUT,
+            connect=AUTH_PROVIDER_CONNECT_TIMEOUT,
+            sock_read=AUTH_PROVIDER_READ_TIMEOUT
+        )
+        _auth_http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _auth_http_session
+
+async def close_auth_http_session():
+    global _auth_http_session
+    if _auth_http_session is not None:
+        await _auth_http_session.close()
+        _auth_http_session = None
+
+async def fetch_google_session_data(session_id: str) -> dict:
+    """Exchange an auth provider session id for the user's profile and session token"""
+    try:
+        async with get_auth_http_session().get(GOOGLE_SESSION_DATA_URL, headers={"X-Session-ID": session_id}) as resp:
+            if resp.status != 200:
+                raise HTTPException(status_code=401, detail="Invalid session ID")
+            return await resp.json()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Auth provider timed out")
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=502, detail=f"Failed to verify session: {str(e)}")
+
 @api_router.post("/auth/google/session-data", response_model=GoogleUserData)
 async def process_google_session(request: Request, response: Response):
     """Process Google OAuth session data from Emergent Auth"""
@@ -540,18 +2573,7 @@ async def process_google_session(request: Request, response: Response):
         raise HTTPException(status_code=400, detail="Session ID required in X-Session-ID header")
     
     # Call Emergent Auth API to get user data
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            ) as resp:
-                if resp.status != 200:
-                    raise HTTPException(status_code=401, detail="Invalid session ID")
-                
-                user_data = await resp.json()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to verify session: {str(e)}")
+    user_data = await fetch_google_session_data(session_id)
     
     # Create or update user in database
     existing_user = await db[users_collection].find_one({"email": user_data["email"]})
@@ -572,7 +2594,12 @@ async def process_google_session(request: Request, response: Response):
             "is_admin": False,
             "created_at": datetime.now(timezone.utc)
         }
-        await db[users_collection].insert_one(new_user)
+        try:
+            await db[users_collection].insert_one(new_user)
+        except DuplicateKeyError:
+            # Another login created the user first
+            existing_user = await db[users_collection].find_one({"email": user_data["email"]})
+            user_id = existing_user["id"]
     
     # Store session token in database
     session_expires = datetime.now(timezone.utc) + timedelta(days=7)
@@ -583,7 +2610,7 @@ async def process_google_session(request: Request, response: Response):
         "expires_at": session_expires,
         "created_at": datetime.now(timezone.utc)
     }
-    await db[sessions_collection].insert_one(session_doc)
+    await session_store.create(session_doc)
     
     # Set httpOnly cookie
     response.set_cookie(
@@ -599,19 +2626,30 @@ async def process_google_session(request: Request, response: Response):
     return GoogleUserData(**user_data)
 
 @api_router.post("/auth/logout")
-async def logout(request: Request, response: Response):
-    """Logout user and clear session"""
+async def logout(request: Request, response: Response, logout_data: Optional[LogoutRequest] = None):
+    """Logout user, revoke their tokens and clear session"""
+    
+    # Revoke the presented access token and refresh token, if they are still valid
+    auth_header = request.headers.get("Authorization")
+    presented = []
+    if auth_header and auth_header.startswith("Bearer "):
+        presented.append((auth_header.split(" ")[1], "access"))
+    if logout_data and logout_data.refresh_token:
+        presented.append((logout_data.refresh_token, "refresh"))
+    for token, token_type in presented:
+        try:
+            await token_revocations.revoke_token(decode_token(token, token_type))
+        except JWTError:
+            pass
     
     # Get session token from cookie or header
     session_token = request.cookies.get("session_token")
     if not session_token:
-        auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             session_token = auth_header.split(" ")[1]
     
     if session_token:
-        # Delete session from database
-        await db[sessions_collection].delete_many({"session_token": session_token})
+        await session_store.delete(session_token)
     
     # Clear cookie
     response.delete_cookie(
@@ -623,6 +2661,7 @@ async def logout(request: Request, response: Response):
     return {"message": "Logged out successfully"}
 
 # Updated authentication helper to check session tokens
+@traced("auth.get_current_user_with_session")
 async def get_current_user_with_session(request: Request) -> User:
     """Get current user from JWT token or session token"""
     
@@ -630,18 +2669,9 @@ async def get_current_user_with_session(request: Request) -> User:
     session_token = request.cookies.get("session_token")
     
     if session_token:
-        # Check session token
-        session_doc = await db[sessions_collection].find_one({
-            "session_token": session_token,
-            "expires_at": {"$gt": datetime.now(timezone.utc)}
-        })
-        
-        if session_doc:
-            # Get user from session
-            user_doc = await db[users_collection].find_one({"id": session_doc["user_id"]})
-            if user_doc:
-                user_response = {k: v for k, v in user_doc.items() if k != 'password_hash'}
-                return User(**user_response)
+        user = await session_store.resolve(session_token)
+        if user:
+            return user
     
     # Fallback to JWT token
     try:
@@ -651,77 +2681,431 @@ async def get_current_user_with_session(request: Request) -> User:
             raise HTTPException(status_code=401, detail="Not authenticated")
         
         token = auth_header.split(" ")[1]
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id = payload.get("sub")
         
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user_doc = await db[users_collection].find_one({"id": user_id})
-        if not user_doc:
+        user = await user_cache.get(user_id)
+        if not user:
             raise HTTPException(status_code=401, detail="User not found")
-        
-        user_response = {k: v for k, v in user_doc.items() if k != 'password_hash'}
-        return User(**user_response)
+        return user
         
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+ORDERS_PAGE_DEFAULT_LIMIT = 100
+ORDERS_PAGE_MAX_LIMIT = 500
+
 @api_router.get("/orders", response_model=List[Order])
-async def get_orders(current_user: User = Depends(get_current_user)):
-    if current_user.is_admin:
-        orders = await db[orders_collection].find().to_list(1000)
-    else:
-        orders = await db[orders_collection].find({"user_id": current_user.id}).to_list(1000)
+async def get_orders(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=ORDERS_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    claims: TokenClaims = Depends(get_token_claims)
+):
+    """List orders newest first, paginated by an opaque (created_at, id) cursor.
     
-    return [Order(**{k: v for k, v in order.items() if k != '_id'}) for order in orders]
+    With stream=true the orders are sent as NDJSON while they are read from the
+    database, and limit is optional.
+    """
+    filter_query = {} if claims.is_admin else {"user_id": claims.user_id}
+    if cursor:
+        position = decode_cursor(cursor)
+        try:
+            created_at = datetime.fromisoformat(position["created_at"])
+            order_id = position["id"]
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        filter_query.update(keyset_filter("created_at", created_at, order_id, ascending=False))
+    
+    query = db[orders_collection].find(filter_query, model_projection(Order)).sort([("created_at", -1), ("id", -1)])
+    
+    if stream:
+        if limit:
+            query = query.limit(limit)
+        
+        async def ndjson_orders():
+            async for order in query:
+                if FAST_JSON_RESPONSES:
+                    yield orjson.dumps(fill_defaults(Order, order), option=FAST_JSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+                else:
+                    yield Order(**order).json() + "\n"
+        
+        return StreamingResponse(ndjson_orders(), media_type="application/x-ndjson")
+    
+    # One extra document tells us whether there is a next page
+    page_size = limit or ORDERS_PAGE_DEFAULT_LIMIT
+    orders = await query.limit(page_size + 1).to_list(page_size + 1)
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        last = orders[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor({"created_at": last["created_at"], "id": last["id"]})
+    
+    if FAST_JSON_RESPONSES:
+        # Returned as is, so FastAPI does not validate against response_model again
+        return Response(
+            content=encode_json(serialize_documents(Order, orders)),
+            media_type="application/json",
+            headers={k: v for k, v in response.headers.items() if k.lower() == "x-next-cursor"}
+        )
+    return [Order(**order) for order in orders]
 
 @api_router.put("/orders/{order_id}/status")
-async def update_order_status(order_id: str, status: str, current_user: User = Depends(get_current_user)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    # Get order details before updating for email
-    order = await db[orders_collection].find_one({"id": order_id})
-    if not order:
+async def update_order_status(order_id: str, status: str, admin: TokenClaims = Depends(require_admin)):
+    existing = await db[orders_collection].find_one({"id": order_id}, {"_id": 0, "status": 1, "items": 1})
+    if not existing:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    result = await db[orders_collection].update_one(
-        {"id": order_id}, 
+    # Leaving cancelled takes the stock again, or fails with 409 if it has been sold since
+    reopening = existing.get("status") == "cancelled" and status != "cancelled"
+    if reopening:
+        await reserve_inventory(order_id, [CartItem(**item) for item in existing.get("items", [])])
+    
+    # A concurrent cancel or reopen must not slip in between the read and the update
+    if status == "cancelled":
+        condition = {}
+    elif reopening:
+        condition = {"status": "cancelled"}
+    else:
+        condition = {"status": {"$ne": "cancelled"}}
+    
+    # The order as it was before this update, read atomically with it, drives
+    # the email, the stock and the sales rollup adjustments
+    order = await db[orders_collection].find_one_and_update(
+        {"id": order_id, **condition},
         {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}}
     )
+    if not order:
+        if reopening:
+            await restock_orders([existing])
+        raise HTTPException(status_code=409, detail="Order changed while being updated, please retry")
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Order not found")
+    # Cancelled orders do not count as sales and hold no stock
+    if order.get("status") != "cancelled" and status == "cancelled":
+        await apply_sales_rollup(order, -1)
+        await restock_orders([order])
+    elif reopening:
+        await apply_sales_rollup(order, 1)
     
-    # Send status update email if customer email is available
+    # Queue status update email if customer email is available
     if order.get('customer_email'):
         customer_name = order.get('customer_name') or "Valued Customer"
-        send_order_status_update_email(order['customer_email'], customer_name, order, status)
+        subject, body = build_order_status_update_email(customer_name, order, status)
+        await queue_email(order['customer_email'], subject, body)
     
     return {"message": "Order status updated successfully"}
 
+# Statuses each status may move to with the bulk endpoint
+ORDER_STATUS_TRANSITIONS = {
+    "pending": {"confirmed", "cancelled"},
+    "confirmed": {"shipped", "cancelled"},
+    "shipped": {"delivered"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+ORDER_BULK_MAX_IDS = int(os.environ.get('ORDER_BULK_MAX_IDS', '500'))
+
+@api_router.post("/orders/bulk-status")
+async def bulk_update_order_status(update: OrderBulkStatusUpdate, admin: TokenClaims = Depends(require_admin)):
+    """Move many orders to one status with a single bulk_write, reporting the outcome per order.
+    
+    Results: updated, unchanged (already in that status), not_found,
+    invalid_transition, or conflict (the order changed while being updated).
+    """
+    order_ids = list(dict.fromkeys(update.order_ids))
+    if len(order_ids) > ORDER_BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {ORDER_BULK_MAX_IDS} orders can be updated at once")
+    
+    orders = {}
+    async for order in db[orders_collection].find({"id": {"$in": order_ids}}, {"_id": 0}):
+        orders[order["id"]] = order
+    
+    results = {}
+    candidates = []
+    for order_id in order_ids:
+        order = orders.get(order_id)
+        if not order:
+            results[order_id] = {"order_id": order_id, "result": "not_found"}
+            continue
+        current = order.get("status", "pending")
+        results[order_id] = {"order_id": order_id, "previous_status": current}
+        if current == update.status:
+            results[order_id]["result"] = "unchanged"
+        elif update.status not in ORDER_STATUS_TRANSITIONS.get(current, set()):
+            results[order_id]["result"] = "invalid_transition"
+        else:
+            candidates.append(order)
+    
+    updated = []
+    if candidates:
+        now = datetime.now(timezone.utc)
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # Mongo keeps milliseconds
+        # Each update only applies if the order is still in the status it was validated against
+        operations = [
+            UpdateOne({"id": order["id"], "status": order.get("status", "pending")},
+                      {"$set": {"status": update.status, "updated_at": now}})
+            for order in candidates
+        ]
+        result = await db[orders_collection].bulk_write(operations, ordered=False)
+        if result.modified_count == len(operations):
+            updated = candidates
+        else:
+            applied = set(await db[orders_collection].distinct(
+                "id", {"id": {"$in": [order["id"] for order in candidates]}, "updated_at": now}
+            ))
+            updated = [order for order in candidates if order["id"] in applied]
+        
+        updated_ids = {order["id"] for order in updated}
+        for order in candidates:
+            results[order["id"]]["result"] = "updated" if order["id"] in updated_ids else "conflict"
+    
+    if update.status == "cancelled":
+        await apply_sales_rollups(updated, -1)
+        await restock_orders(updated)
+    
+    emails = []
+    for order in updated:
+        if order.get("customer_email"):
+            customer_name = order.get("customer_name") or "Valued Customer"
+            emails.append((order["customer_email"], *build_order_status_update_email(customer_name, order, update.status)))
+    await queue_emails(emails)
+    
+    return {
+        "status": update.status,
+        "updated": len(updated),
+        "results": [results[order_id] for order_id in order_ids]
+    }
+
 @api_router.delete("/orders/{order_id}")
-async def delete_order(order_id: str, current_user: User = Depends(get_current_user)):
+async def delete_order(order_id: str, admin: TokenClaims = Depends(require_admin)):
     """Delete an order (admin only)"""
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    result = await db[orders_collection].delete_one({"id": order_id})
-    if result.deleted_count == 0:
+    order = await db[orders_collection].find_one_and_delete({"id": order_id})
+    if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    if order.get("status") != "cancelled":
+        await apply_sales_rollup(order, -1)
+        await restock_orders([order])
+    
     return {"message": "Order deleted successfully"}
 
 @api_router.delete("/orders")
-async def clear_all_orders(current_user: User = Depends(get_current_user)):
-    """Clear all orders (admin only - for database cleanup)"""
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def clear_all_orders(admin: TokenClaims = Depends(require_admin)):
+    """Clear all orders (admin only - for database cleanup); stock is not given back"""
     result = await db[orders_collection].delete_many({})
+    await db[sales_rollups_collection].delete_many({})
     return {"message": f"Deleted {result.deleted_count} orders successfully"}
 
+# Admin maintenance routes
+@api_router.get("/admin/indexes")
+async def get_index_report(refresh: bool = False, admin: TokenClaims = Depends(require_admin)):
+    """Result of the last index reconciliation"""
+    if refresh or not index_report:
+        await ensure_indexes()
+    return index_report
+
+@api_router.put("/admin/users/{user_id}/admin", response_model=User)
+async def set_user_admin(user_id: str, update: AdminFlagUpdate, admin: TokenClaims = Depends(require_admin)):
+    """Grant or revoke admin access"""
+    result = await db[users_collection].update_one({"id": user_id}, {"$set": {"is_admin": update.is_admin}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    user_cache.invalidate(user_id)
+    # Outstanding access tokens carry the old role claim
+    await token_revocations.revoke_user_access_tokens(user_id)
+    return await user_cache.get(user_id)
+
+@api_router.get("/admin/user-cache")
+async def get_user_cache_stats(admin: TokenClaims = Depends(require_admin)):
+    """Hit and miss counters of the authenticated user cache"""
+    return user_cache.stats()
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    collection: Optional[str] = None,
+    collscan_only: bool = False,
+    admin: TokenClaims = Depends(require_admin)
+):
+    """Most recent commands slower than SLOW_QUERY_MS, newest first"""
+    entries = []
+    for entry in reversed(list(slow_query_log.entries)):
+        if collection and entry["collection"] != collection:
+            continue
+        if collscan_only and not (entry["explain"] or {}).get("collscan"):
+            continue
+        entries.append(entry)
+        if len(entries) >= limit:
+            break
+    return {"threshold_ms": SLOW_QUERY_MS, "explain_sample": SLOW_QUERY_EXPLAIN_SAMPLE, "entries": entries}
+
+@api_router.delete("/admin/slow-queries")
+async def clear_slow_queries(admin: TokenClaims = Depends(require_admin)):
+    slow_query_log.entries.clear()
+    return {"message": "Slow query log cleared"}
+
+# Admin statistics
+ADMIN_STATS_CACHE_SECONDS = float(os.environ.get('ADMIN_STATS_CACHE_SECONDS', '30'))
+ADMIN_STATS_TOP_N = 5
+admin_stats_cache = TTLCache(maxsize=64, ttl=ADMIN_STATS_CACHE_SECONDS)
+
+async def compute_admin_stats(days: int, low_stock_threshold: int) -> dict:
+    """Dashboard figures for orders placed in the last `days` days, aggregated in Mongo"""
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=days)
+    in_period = {"$match": {"created_at": {"$gte": since}}}
+    orders = db[orders_collection]
+    
+    by_status_pipeline = [
+        in_period,
+        {"$group": {"_id": "$status", "orders": {"$sum": 1}, "revenue": {"$sum": "$total_amount"}}},
+    ]
+    per_day_pipeline = [
+        in_period,
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+            "orders": {"$sum": 1},
+            "revenue": {"$sum": "$total_amount"}
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    units_per_product = [
+        in_period,
+        {"$unwind": "$items"},
+        {"$group": {"_id": "$items.product_id", "quantity": {"$sum": "$items.quantity"}}},
+    ]
+    product_lookup = [
+        {"$lookup": {"from": products_collection, "localField": "_id", "foreignField": "id", "as": "product"}},
+        {"$unwind": {"path": "$product", "preserveNullAndEmptyArrays": True}},
+    ]
+    top_products_pipeline = units_per_product + [
+        {"$sort": {"quantity": -1, "_id": 1}},
+        {"$limit": ADMIN_STATS_TOP_N},
+        *product_lookup,
+        {"$project": {
+            "_id": 0, "product_id": "$_id", "quantity": 1,
+            "name": "$product.name", "price": "$product.price"
+        }},
+    ]
+    # Revenue per category is estimated from current prices; order lines do not keep the price paid
+    top_categories_pipeline = units_per_product + product_lookup + [
+        {"$group": {
+            "_id": "$product.category_id",
+            "quantity": {"$sum": "$quantity"},
+            "revenue": {"$sum": {"$multiply": ["$quantity", {"$ifNull": ["$product.price", 0]}]}}
+        }},
+        {"$sort": {"quantity": -1, "_id": 1}},
+        {"$limit": ADMIN_STATS_TOP_N},
+        {"$lookup": {"from": categories_collection, "localField": "_id", "foreignField": "id", "as": "category"}},
+        {"$unwind": {"path": "$category", "preserveNullAndEmptyArrays": True}},
+        {"$project": {"_id": 0, "category_id": "$_id", "name": "$category.name", "quantity": 1, "revenue": 1}},
+    ]
+    low_stock_query = {"inventory": {"$lt": low_stock_threshold}}
+    
+    (by_status, per_day, top_products, top_categories,
+     low_stock, low_stock_count, total_products, total_categories) = await asyncio.gather(
+        orders.aggregate(by_status_pipeline).to_list(None),
+        orders.aggregate(per_day_pipeline).to_list(None),
+        orders.aggregate(top_products_pipeline).to_list(None),
+        orders.aggregate(top_categories_pipeline).to_list(None),
+        db[products_collection].find(low_stock_query, {"_id": 0, "id": 1, "name": 1, "price": 1, "inventory": 1})
+            .sort([("inventory", ASCENDING), ("id", ASCENDING)]).limit(ADMIN_STATS_TOP_N).to_list(ADMIN_STATS_TOP_N),
+        db[products_collection].count_documents(low_stock_query),
+        db[products_collection].estimated_document_count(),
+        db[categories_collection].estimated_document_count(),
+    )
+    
+    total_orders = sum(group["orders"] for group in by_status)
+    total_revenue = sum(group["revenue"] for group in by_status)
+    return {
+        "period_days": days,
+        "since": since,
+        "generated_at": now,
+        "total_orders": total_orders,
+        "total_revenue": total_revenue,
+        "avg_order_value": total_revenue / total_orders if total_orders else 0,
+        "revenue_by_status": {
+            group["_id"]: {"orders": group["orders"], "revenue": group["revenue"]} for group in by_status
+        },
+        "orders_per_day": [
+            {"date": day["_id"], "orders": day["orders"], "revenue": day["revenue"]} for day in per_day
+        ],
+        "top_products": top_products,
+        "top_categories": top_categories,
+        "total_products": total_products,
+        "total_categories": total_categories,
+        "low_stock_threshold": low_stock_threshold,
+        "low_stock_count": low_stock_count,
+        "low_stock_products": low_stock,
+    }
+
+@api_router.get("/admin/stats")
+async def get_admin_stats(
+    days: int = Query(30, ge=1, le=3660),
+    low_stock_threshold: int = Query(10, ge=1),
+    refresh: bool = False,
+    admin: TokenClaims = Depends(require_admin)
+):
+    """Dashboard statistics, cached for ADMIN_STATS_CACHE_SECONDS"""
+    key = (days, low_stock_threshold)
+    stats = None if refresh else admin_stats_cache.get(key)
+    if stats is None:
+        stats = await compute_admin_stats(days, low_stock_threshold)
+        admin_stats_cache[key] = stats
+    return stats
+
+# Sales reports
+@api_router.get("/admin/sales")
+async def get_sales_report(
+    start: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    end: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    group_by: List[Literal["day", "product_id", "category_id", "delivery_option"]] = Query(["day"]),
+    product_id: Optional[str] = None,
+    category_id: Optional[str] = None,
+    delivery_option: Optional[str] = None,
+    admin: TokenClaims = Depends(require_admin)
+):
+    """Units, revenue and orders between two UTC days (inclusive), read from the sales rollups.
+    
+    Orders are counted once per product line, so grouping by anything other than
+    product_id can count an order containing several products more than once.
+    """
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    
+    match = {"day": {"$gte": start, "$lte": end}}
+    for field, value in (("product_id", product_id), ("category_id", category_id), ("delivery_option", delivery_option)):
+        if value is not None:
+            match[field] = value
+    
+    group_fields = list(dict.fromkeys(group_by))
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {field: f"${field}" for field in group_fields},
+            "units": {"$sum": "$units"},
+            "revenue": {"$sum": "$revenue"},
+            "orders": {"$sum": "$orders"}
+        }},
+        {"$sort": {f"_id.{field}": 1 for field in group_fields}},
+    ]
+    groups = await db[sales_rollups_collection].aggregate(pipeline).to_list(None)
+    
+    rows = [{**group["_id"], "units": group["units"], "revenue": group["revenue"], "orders": group["orders"]}
+            for group in groups]
+    return {
+        "start": start,
+        "end": end,
+        "group_by": group_fields,
+        "total_units": sum(row["units"] for row in rows),
+        "total_revenue": sum(row["revenue"] for row in rows),
+        "rows": rows
+    }
+
 # User profile routes
 @api_router.get("/profile", response_model=User)
 async def get_profile(current_user: User = Depends(get_current_user)):
@@ -740,12 +3124,238 @@ async def update_profile(user_data: dict, current_user: User = Depends(get_curre
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
-    updated_user = await db[users_collection].find_one({"id": current_user.id})
+    user_cache.invalidate(current_user.id)
+    updated_user = await db[users_collection].find_one({"id": current_user.id}, {"_id": 0, "password_hash": 0})
     return User(**updated_user)
 
+# Rate limiting
+# Token buckets per client IP and per authenticated user on the expensive
+# routes. A rule "N/S" allows bursts of N requests, refilled at N per S seconds.
+# Off by default: only enable it where the server sees real client addresses,
+# either directly, through uvicorn --proxy-headers --forwarded-allow-ips, or by
+# setting RATE_LIMIT_TRUSTED_PROXY_HOPS. Behind an ingress without either, every
+# shopper shares the ingress address and the limits apply to the whole site.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'false').lower() == 'true'
+RATE_LIMIT_SHARDS = int(os.environ.get('RATE_LIMIT_SHARDS', '16'))
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '100000'))  # per shard
+# Number of proxies in front of the server that each append to X-Forwarded-For.
+# The client IP is the address the outermost of them saw; entries further left
+# are sent by the client and cannot be trusted. 0 uses the connection address.
+RATE_LIMIT_TRUSTED_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXY_HOPS', '0'))
+RATE_LIMIT_RULES = {
+    ("POST", "/api/auth/login"): os.environ.get('RATE_LIMIT_LOGIN', '10/60'),
+    ("POST", "/api/auth/register"): os.environ.get('RATE_LIMIT_REGISTER', '5/300'),
+    ("POST", "/api/orders"): os.environ.get('RATE_LIMIT_ORDERS', '20/60'),
+}
+
+def _parse_rate(rule: str) -> tuple:
+    """'N/S' -> (capacity, tokens per second)"""
+    burst, seconds = rule.split("/")
+    return float(burst), float(burst) / float(seconds)
+
+class TokenBucketLimiter:
+    """In-memory token buckets, sharded so unrelated clients never share a lock"""
+
+    def __init__(self, rules: Dict[tuple, str], shards: int = RATE_LIMIT_SHARDS):
+        self.rules = {route: _parse_rate(rule) for route, rule in rules.items()}
+        # An idle bucket refills completely within this time, so forgetting it is harmless
+        full_refill = max((capacity / rate for capacity, rate in self.rules.values()), default=1)
+        self.shards = [
+            (threading.Lock(), TTLCache(maxsize=RATE_LIMIT_MAX_BUCKETS, ttl=full_refill))
+            for _ in range(shards)
+        ]
+        self.throttled = 0
+
+    def acquire(self, route: tuple, keys: List[str]) -> float:
+        """Take one token from every key's bucket; 0 if allowed, else seconds until it would be"""
+        capacity, rate = self.rules[route]
+        now = time.monotonic()
+        taken = []
+        for key in keys:
+            bucket_key = (route, key)
+            lock, buckets = self.shards[hash(bucket_key) % len(self.shards)]
+            with lock:
+                tokens, updated = buckets.get(bucket_key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    wait = (1 - tokens) / rate
+                    break
+                buckets[bucket_key] = (tokens - 1, now)
+                taken.append(bucket_key)
+        else:
+            return 0
+        
+        # Give back tokens already taken from the other buckets
+        for bucket_key in taken:
+            lock, buckets = self.shards[hash(bucket_key) % len(self.shards)]
+            with lock:
+                tokens, updated = buckets.get(bucket_key, (capacity, now))
+                buckets[bucket_key] = (min(capacity, tokens + 1), updated)
+        self.throttled += 1
+        return wait
+
+rate_limiter = TokenBucketLimiter(RATE_LIMIT_RULES)
+
+def _client_ip(scope) -> str:
+    if RATE_LIMIT_TRUSTED_PROXY_HOPS:
+        forwarded = [
+            address.strip()
+            for name, value in scope.get("headers", ())
+            if name == b"x-forwarded-for"
+            for address in value.decode("latin-1").split(",")
+        ]
+        if len(forwarded) >= RATE_LIMIT_TRUSTED_PROXY_HOPS:
+            return forwarded[-RATE_LIMIT_TRUSTED_PROXY_HOPS]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def _bearer_user_id(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return decode_token(token).get("sub")
+            except (JWTError, HTTPException):
+                return None
+    return None
+
+class RateLimitMiddleware:
+    """ASGI middleware; routes without a rule cost one dict lookup"""
+
+    def __init__(self, app, limiter: TokenBucketLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and RATE_LIMIT_ENABLED:
+            route = (scope["method"], scope["path"].rstrip("/") or "/")
+            if route in self.limiter.rules:
+                keys = ["ip:" + _client_ip(scope)]
+                user_id = _bearer_user_id(scope)
+                if user_id:
+                    keys.append("user:" + user_id)
+                wait = self.limiter.acquire(route, keys)
+                if wait:
+                    response = JSONResponse(
+                        status_code=429,
+                        content={"detail": "Too many requests, please try again later"},
+                        headers={"Retry-After": str(math.ceil(wait))}
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+# Metrics endpoint
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Answered before routing (rate limited) or matched no route
+    for candidate in app.router.routes:
+        if candidate.matches(scope)[0] != Match.NONE:
+            return candidate.path
+    return "unmatched"
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency by route template and status code"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                scope["method"] if scope["method"] in HTTP_METHODS else "other",
+                _route_template(scope),
+                str(status_code)
+            )
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of sampled requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_SAMPLE_RATE or random.random() >= TRACE_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+
+        span = Span(f"HTTP {scope['method']}", kind="server",
+                    attributes={"http.method": scope["method"], "http.target": scope["path"]})
+        status_code = 500
+        async def send_with_trace_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", span.trace_id.encode())]
+            await send(message)
+
+        with span:
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                route = _route_template(scope)
+                span.name = f"{scope['method']} {route}"
+                span.attributes["http.route"] = route
+                span.attributes["http.status_code"] = status_code
+                if status_code >= 500:
+                    span.error = f"HTTP {status_code}"
+
+def runtime_metrics() -> List[str]:
+    """Counters the application already keeps, read at scrape time"""
+    values = [
+        ("saahaz_user_cache_hits_total", "counter", "Authenticated user cache hits", user_cache.hits),
+        ("saahaz_user_cache_misses_total", "counter", "Authenticated user cache misses", user_cache.misses),
+        ("saahaz_rate_limited_total", "counter", "Requests rejected by the rate limiter", rate_limiter.throttled),
+        ("saahaz_password_jobs_pending", "gauge", "bcrypt jobs running or queued", _password_jobs_pending),
+    ]
+    lines = []
+    for name, kind, help_text, value in values:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return lines
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    lines = []
+    for metric in (http_request_seconds, mongo_command_seconds, mongo_documents):
+        lines += metric.render()
+    lines += runtime_metrics()
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(RateLimitMiddleware)
+
+# Outside the rate limiter so rejected requests are timed too
+app.add_middleware(MetricsMiddleware)
+
+app.add_middleware(TracingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -761,6 +3371,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=['X-Next-Cursor', 'X-Total-Count', 'ETag', 'Retry-After', 'X-Trace-Id'],
 )
 
 # Configure logging
@@ -770,6 +3381,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def bootstrap_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_background_workers():
+    global _revocation_sync_task, _catalog_sync_task, _session_sweep_task, _trace_export_task
+    start_email_outbox_workers()
+    slow_query_log.loop = asyncio.get_running_loop()
+    _revocation_sync_task = asyncio.create_task(_revocation_sync_loop())
+    _catalog_sync_task = asyncio.create_task(_catalog_version_sync_loop())
+    _session_sweep_task = asyncio.create_task(_session_sweep_loop())
+    if TRACE_SAMPLE_RATE > 0:
+        _trace_export_task = asyncio.create_task(_trace_export_loop())
+    get_auth_http_session()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await stop_email_outbox_workers()
+    for task in (_revocation_sync_task, _catalog_sync_task, _session_sweep_task, _trace_export_task):
+        if task:
+            task.cancel()
+    await close_auth_http_session()
+    await stop_tracing()
+    password_executor.shutdown(wait=False)
     client.close()
\ No newline at end of file
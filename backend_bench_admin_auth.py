@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Admin authorization benchmark.
+
+Compares the per-request cost of deciding that a caller is an admin:
+
+  before: decode the JWT, load the user document from Mongo, build a User
+          model and read is_admin (what every admin route used to do)
+  after:  decode the JWT, check the in-memory revocation list and read the
+          role claim (require_admin)
+
+Runs in-process against the database configured in backend/.env
+(MONGO_URL / DB_NAME). A temporary admin user is created and removed.
+
+Usage:
+    python backend_bench_admin_auth.py --iterations 2000
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import jwt  # noqa: E402
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+
+import server  # noqa: E402
+
+
+async def legacy_admin_check(token: str) -> bool:
+    """The admin check as it was done before role claims"""
+    payload = jwt.decode(token, server.SECRET_KEY, algorithms=[server.ALGORITHM])
+    user_doc = await server.db[server.users_collection].find_one({"id": payload["sub"]})
+    user_response = {k: v for k, v in user_doc.items() if k not in ['password_hash', '_id']}
+    return server.User(**user_response).is_admin
+
+
+async def claims_admin_check(token: str) -> bool:
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    claims = await server.require_admin(await server.get_token_claims(credentials))
+    return claims.is_admin
+
+
+async def measure(check, token, iterations):
+    for _ in range(min(100, iterations)):  # warm up connections and caches
+        await check(token)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        assert await check(token)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(name, samples):
+    ordered = sorted(samples)
+    p50 = ordered[len(ordered) // 2] * 1e6
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6
+    mean = statistics.mean(samples) * 1e6
+    print(f"   {name:<8} mean {mean:8.1f}µs  p50 {p50:8.1f}µs  p99 {p99:8.1f}µs")
+    return mean
+
+
+async def run(args):
+    user_id = f"bench-admin-{uuid.uuid4()}"
+    await server.db[server.users_collection].insert_one({
+        "id": user_id,
+        "email": f"{user_id}@saahaz.com",
+        "name": "Bench Admin",
+        "is_admin": True,
+        "password_hash": ""
+    })
+    try:
+        token = server.create_access_token({"sub": user_id, "admin": True})
+        print(f"🔐 Admin authorization, {args.iterations} iterations each")
+        before = summarize("before", await measure(legacy_admin_check, token, args.iterations))
+        after = summarize("after", await measure(claims_admin_check, token, args.iterations))
+        print(f"   Speedup: {before / after:.1f}x")
+        return after < before
+    finally:
+        await server.db[server.users_collection].delete_one({"id": user_id})
+        server.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Admin authorization latency, database lookup vs token claims")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    success = asyncio.run(run(args))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
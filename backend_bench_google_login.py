@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Google session exchange benchmark.
+
+Starts a local stand-in for the auth provider and points the backend at it
+through GOOGLE_SESSION_DATA_URL, then compares session exchanges:
+
+  before: a new aiohttp.ClientSession (and TCP connection) per login, as
+          process_google_session used to do
+  after:  the pooled application-lifetime client (fetch_google_session_data)
+
+It also checks that a provider that stops answering is cut off by the read
+timeout instead of pinning the request. Runs in-process; no database needed.
+
+Usage:
+    python backend_bench_google_login.py --logins 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from aiohttp import web
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saahaz_bench")
+
+from fastapi import HTTPException  # noqa: E402
+
+import server  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def start_provider(hang_seconds):
+    """Stand-in auth provider; session id "hang" never answers within the timeout"""
+    async def session_data(request):
+        session_id = request.headers.get("X-Session-ID")
+        if session_id == "hang":
+            await asyncio.sleep(hang_seconds)
+        return web.json_response({
+            "id": session_id,
+            "email": f"{session_id}@saahaz.com",
+            "name": "Bench User",
+            "picture": "",
+            "session_token": uuid.uuid4().hex
+        })
+
+    app = web.Application()
+    app.router.add_get("/auth/v1/env/oauth/session-data", session_data)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/auth/v1/env/oauth/session-data"
+
+
+async def legacy_exchange(url, session_id):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers={"X-Session-ID": session_id}) as resp:
+            return await resp.json()
+
+
+async def run_logins(exchange, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login(n):
+        async with semaphore:
+            start = time.perf_counter()
+            await exchange(f"bench-{n}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[login(n) for n in range(total)])
+    return latencies, time.perf_counter() - start
+
+
+def summarize(name, latencies, elapsed):
+    print(f"   {name:<7} {len(latencies) / elapsed:8.1f} logins/s  "
+          f"p50 {percentile(latencies, 0.5) * 1000:6.2f}ms  p99 {percentile(latencies, 0.99) * 1000:6.2f}ms")
+    return len(latencies) / elapsed
+
+
+async def run(args):
+    runner, url = await start_provider(args.read_timeout * 3)
+    # Read when the pooled client is first created
+    server.GOOGLE_SESSION_DATA_URL = url
+    server.AUTH_PROVIDER_READ_TIMEOUT = args.read_timeout
+
+    try:
+        print(f"🔑 {args.logins} session exchanges at concurrency {args.concurrency} against {url}")
+        before = summarize("before", *await run_logins(lambda sid: legacy_exchange(url, sid),
+                                                       args.logins, args.concurrency))
+        after = summarize("after", *await run_logins(server.fetch_google_session_data,
+                                                     args.logins, args.concurrency))
+        print(f"   Speedup: {after / before:.1f}x")
+
+        start = time.perf_counter()
+        try:
+            await server.fetch_google_session_data("hang")
+            status_code = 200
+        except HTTPException as e:
+            status_code = e.status_code
+        hung_for = time.perf_counter() - start
+        print(f"   Hung provider answered with {status_code} after {hung_for:.2f}s")
+
+        checks = {
+            "pooled client is faster": after > before,
+            "hung provider is cut off": status_code == 504 and hung_for < args.read_timeout * 2,
+        }
+        for name, passed in checks.items():
+            print(f"{'✅' if passed else '❌'} {name}")
+        return all(checks.values())
+    finally:
+        await server.close_auth_http_session()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Google session exchange, per-login client vs pooled client")
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--read-timeout", type=float, default=1.0,
+                        help="AUTH_PROVIDER_READ_TIMEOUT used for the run")
+    args = parser.parse_args()
+
+    success = asyncio.run(run(args))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
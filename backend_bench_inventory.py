@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for inventory reservation.
+
+Fires hundreds of simultaneous POST /api/orders at a single hot product and
+checks that exactly `stock` orders succeed, inventory never goes negative,
+and the burst completes far faster than the same orders placed one by one.
+
+All orders come from one address, so the server must run with rate limiting
+off (RATE_LIMIT_ENABLED=false, the default); otherwise the burst is cut short
+by 429s and the run stops with an error.
+
+Usage:
+    python backend_bench_inventory.py --base-url http://localhost:8001 --orders 300 --stock 100
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+
+
+async def login(session, api_url, email, password):
+    async with session.post(f"{api_url}/auth/login", json={"email": email, "password": password}) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"Admin login failed with status {resp.status}")
+        data = await resp.json()
+        return {"Authorization": f"Bearer {data['access_token']}"}
+
+
+async def create_product(session, api_url, headers, name, inventory):
+    product = {
+        "name": name,
+        "description": "Inventory benchmark product",
+        "price": 1000,
+        "category_id": "bench",
+        "sizes": ["M"],
+        "colors": ["Black"],
+        "inventory": inventory
+    }
+    async with session.post(f"{api_url}/products", json=product, headers=headers) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"Product creation failed with status {resp.status}")
+        return (await resp.json())["id"]
+
+
+async def place_order(session, api_url, product_id):
+    order = {
+        "customer_name": "Bench Customer",
+        "items": [{"product_id": product_id, "quantity": 1, "size": "M", "color": "Black"}],
+        "delivery_address": "Benchmark Street, Karachi",
+        "phone": "03000000000"
+    }
+    start = time.perf_counter()
+    async with session.post(f"{api_url}/orders", json=order) as resp:
+        body = await resp.json()
+        return resp.status, body.get("id"), time.perf_counter() - start
+
+
+async def run(args):
+    api_url = f"{args.base_url.rstrip('/')}/api"
+    connector = aiohttp.TCPConnector(limit=args.orders)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        headers = await login(session, api_url, args.admin_email, args.admin_password)
+        calibration_id = await create_product(session, api_url, headers, "Bench Calibration", args.calibration_orders)
+        hot_id = await create_product(session, api_url, headers, "Bench Hot Product", args.stock)
+        order_ids = []
+
+        try:
+            # Sequential latency on a separate product gives the cost of one order
+            sequential = []
+            for _ in range(args.calibration_orders):
+                status_code, order_id, elapsed = await place_order(session, api_url, calibration_id)
+                if status_code != 200:
+                    raise RuntimeError(f"Calibration order failed with status {status_code}")
+                order_ids.append(order_id)
+                sequential.append(elapsed)
+            single_latency = statistics.mean(sequential)
+
+            print(f"🔥 Firing {args.orders} concurrent orders at a product with {args.stock} in stock...")
+            burst_start = time.perf_counter()
+            results = await asyncio.gather(*[place_order(session, api_url, hot_id) for _ in range(args.orders)])
+            burst_time = time.perf_counter() - burst_start
+
+            throttled = sum(1 for r in results if r[0] == 429)
+            if throttled:
+                raise RuntimeError(f"{throttled} orders were rate limited; run the server with RATE_LIMIT_ENABLED=false")
+            accepted = [r for r in results if r[0] == 200]
+            rejected = [r for r in results if r[0] == 409]
+            errors = [r for r in results if r[0] not in (200, 409)]
+            order_ids.extend(r[1] for r in accepted)
+
+            async with session.get(f"{api_url}/products/{hot_id}") as resp:
+                remaining = (await resp.json())["inventory"]
+
+            latencies = sorted(r[2] for r in results)
+            serialized_estimate = single_latency * args.orders
+            expected_accepted = min(args.orders, args.stock)
+
+            print(f"   Accepted: {len(accepted)}  Rejected (409): {len(rejected)}  Errors: {len(errors)}")
+            print(f"   Remaining inventory: {remaining}")
+            print(f"   Burst wall time: {burst_time:.3f}s  (serialized estimate {serialized_estimate:.3f}s)")
+            print(f"   Latency p50: {latencies[len(latencies) // 2] * 1000:.1f}ms  "
+                  f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms  "
+                  f"single order: {single_latency * 1000:.1f}ms")
+
+            checks = {
+                "no overselling": len(accepted) == expected_accepted and remaining == args.stock - expected_accepted,
+                "inventory never negative": remaining >= 0,
+                "no server errors": not errors,
+                "no lock-style serialization": burst_time < serialized_estimate * args.max_serial_fraction,
+            }
+            for name, passed in checks.items():
+                print(f"{'✅' if passed else '❌'} {name}")
+            return all(checks.values())
+
+        finally:
+            for order_id in order_ids:
+                await session.delete(f"{api_url}/orders/{order_id}", headers=headers)
+            for product_id in (calibration_id, hot_id):
+                await session.delete(f"{api_url}/products/{product_id}", headers=headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inventory reservation concurrency benchmark")
+    parser.add_argument("--base-url", default=os.environ.get("BACKEND_URL", "http://localhost:8001"))
+    parser.add_argument("--orders", type=int, default=300, help="concurrent orders to fire")
+    parser.add_argument("--stock", type=int, default=100, help="inventory of the hot product")
+    parser.add_argument("--calibration-orders", type=int, default=20)
+    parser.add_argument("--max-serial-fraction", type=float, default=0.5,
+                        help="fail if the burst takes longer than this fraction of fully serialized time")
+    parser.add_argument("--admin-email", default=os.environ.get("ADMIN_EMAIL", "test@saahaz.com"))
+    parser.add_argument("--admin-password", default=os.environ.get("ADMIN_PASSWORD", "password"))
+    args = parser.parse_args()
+
+    success = asyncio.run(run(args))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
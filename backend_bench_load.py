@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Load test for the shop API.
+
+Boots backend/server.py with uvicorn against a local mongod (a throwaway
+database is created and dropped), seeds a catalog, then replays a shop traffic
+mix while ramping up concurrency:
+
+  categories     GET  /api/categories
+  list_products  GET  /api/products
+  view_product   GET  /api/products/{id}
+  guest_order    POST /api/orders
+  admin_orders   GET  /api/orders?limit=100 (as admin)
+
+For every stage and route it reports requests per second and p50/p95/p99
+latency, and saves the results as JSON. Passing an earlier results file with
+--baseline compares the two runs and fails on a p95 or throughput regression.
+
+Usage:
+    python backend_bench_load.py --stages 1 10 25 50 --stage-seconds 15 --output load.json
+    python backend_bench_load.py --baseline load.json --output load_new.json
+    python backend_bench_load.py --base-url http://localhost:8001   # use a running server instead
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import aiohttp
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+# (route label, relative weight)
+TRAFFIC_MIX = [
+    ("categories", 20),
+    ("list_products", 35),
+    ("view_product", 30),
+    ("guest_order", 10),
+    ("admin_orders", 5),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LocalStack:
+    """mongod (optional) and uvicorn running server.py on a throwaway database"""
+
+    def __init__(self, args):
+        self.args = args
+        self.db_name = f"saahaz_load_{uuid.uuid4().hex[:8]}"
+        self.mongo_url = args.mongo_url
+        self.processes = []
+        self.mongo_dir = None
+
+    async def wait_for(self, url, timeout):
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                try:
+                    async with session.get(url) as resp:
+                        if resp.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+    async def start(self):
+        if self.args.start_mongod:
+            self.mongo_dir = tempfile.mkdtemp(prefix="saahaz_mongod_")
+            self.processes.append(subprocess.Popen(
+                [self.args.mongod, "--dbpath", self.mongo_dir, "--port", str(self.args.mongod_port), "--quiet"],
+                stdout=subprocess.DEVNULL
+            ))
+            self.mongo_url = f"mongodb://127.0.0.1:{self.args.mongod_port}"
+
+        env = {
+            **os.environ,
+            "MONGO_URL": self.mongo_url,
+            "DB_NAME": self.db_name,
+            # The load comes from one address, so the per-client limits would throttle it
+            "RATE_LIMIT_ENABLED": "false",
+        }
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(self.args.port),
+             "--workers", str(self.args.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        ))
+        base_url = f"http://127.0.0.1:{self.args.port}"
+        await self.wait_for(f"{base_url}/api/", timeout=30)
+        return base_url
+
+    def create_admin(self, email, password):
+        from pymongo import MongoClient
+        from passlib.context import CryptContext
+
+        with MongoClient(self.mongo_url) as mongo:
+            mongo[self.db_name]["users"].insert_one({
+                "id": str(uuid.uuid4()),
+                "email": email,
+                "name": "Load Test Admin",
+                "password_hash": CryptContext(schemes=["bcrypt"]).hash(password),
+                "phone": "",
+                "address": "",
+                "is_admin": True,
+                "created_at": datetime.now(timezone.utc)
+            })
+
+    def stop(self):
+        try:
+            from pymongo import MongoClient
+            with MongoClient(self.mongo_url, serverSelectionTimeoutMS=2000) as mongo:
+                mongo.drop_database(self.db_name)
+        except Exception as e:
+            print(f"⚠️ Could not drop {self.db_name}: {e}")
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.mongo_dir:
+            shutil.rmtree(self.mongo_dir, ignore_errors=True)
+
+
+async def login(session, api_url, email, password):
+    async with session.post(f"{api_url}/auth/login", json={"email": email, "password": password}) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"Admin login failed with status {resp.status}")
+        return {"Authorization": f"Bearer {(await resp.json())['access_token']}"}
+
+
+async def seed_catalog(session, api_url, admin_headers, products, categories):
+    category_ids = []
+    for n in range(categories):
+        category = {"name": f"Load Category {n}", "description": "Load test category"}
+        async with session.post(f"{api_url}/categories", json=category, headers=admin_headers) as resp:
+            category_ids.append((await resp.json())["id"])
+
+    rows = [json.dumps({
+        "name": f"Load Product {n}",
+        "description": "Cotton kurta used by the load test",
+        "price": 1000 + n % 100 * 50,
+        "category_id": category_ids[n % len(category_ids)],
+        "sizes": ["S", "M", "L"],
+        "colors": ["Black", "White"],
+        "inventory": 1_000_000,
+        "featured": n % 10 == 0
+    }) for n in range(products)]
+    async with session.post(f"{api_url}/admin/products/import", data="\n".join(rows).encode(),
+                            headers={**admin_headers, "Content-Type": "application/x-ndjson"}) as resp:
+        report = await resp.json()
+        if report.get("error_count"):
+            raise RuntimeError(f"Catalog seeding failed: {report['errors'][:3]}")
+
+    product_ids = []
+    cursor = None
+    while True:
+        params = {"limit": 500, **({"cursor": cursor} if cursor else {})}
+        async with session.get(f"{api_url}/products", params=params) as resp:
+            product_ids.extend(product["id"] for product in await resp.json())
+            cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return product_ids
+
+
+def make_actions(api_url, product_ids, admin_headers):
+    async def categories(session):
+        return await session.get(f"{api_url}/categories")
+
+    async def list_products(session):
+        params = {"limit": 20, "sort": random.choice(["created_at", "price", "name"])}
+        return await session.get(f"{api_url}/products", params=params)
+
+    async def view_product(session):
+        return await session.get(f"{api_url}/products/{random.choice(product_ids)}")
+
+    async def guest_order(session):
+        order = {
+            "customer_name": "Load Test Customer",
+            "items": [{"product_id": random.choice(product_ids), "quantity": 1, "size": "M", "color": "Black"}],
+            "delivery_address": "Load Test Street, Karachi",
+            "phone": "03000000000"
+        }
+        return await session.post(f"{api_url}/orders", json=order)
+
+    async def admin_orders(session):
+        return await session.get(f"{api_url}/orders", params={"limit": 100}, headers=admin_headers)
+
+    return {
+        "categories": categories,
+        "list_products": list_products,
+        "view_product": view_product,
+        "guest_order": guest_order,
+        "admin_orders": admin_orders,
+    }
+
+
+async def run_stage(session, actions, concurrency, seconds):
+    routes = [route for route, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+    samples = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    deadline = time.monotonic() + seconds
+
+    async def user():
+        while time.monotonic() < deadline:
+            route = random.choices(routes, weights)[0]
+            start = time.perf_counter()
+            try:
+                async with await actions[route](session) as resp:
+                    await resp.read()
+                    ok = resp.status < 400
+            except aiohttp.ClientError:
+                ok = False
+            samples[route].append(time.perf_counter() - start)
+            if not ok:
+                errors[route] += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*[user() for _ in range(concurrency)])
+    elapsed = time.monotonic() - start
+
+    stage = {"concurrency": concurrency, "seconds": round(elapsed, 2), "routes": {}}
+    for route in routes + ["all"]:
+        latencies = [s for r in routes for s in samples[r]] if route == "all" else samples[route]
+        failed = sum(errors.values()) if route == "all" else errors[route]
+        if not latencies:
+            continue
+        stage["routes"][route] = {
+            "requests": len(latencies),
+            "errors": failed,
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return stage
+
+
+def print_stage(stage):
+    print(f"\n📈 Concurrency {stage['concurrency']} ({stage['seconds']}s)")
+    print(f"   {'route':<14} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, figures in stage["routes"].items():
+        print(f"   {route:<14} {figures['requests']:>8} {figures['errors']:>6} {figures['rps']:>8} "
+              f"{figures['p50_ms']:>8} {figures['p95_ms']:>8} {figures['p99_ms']:>8}")
+
+
+def compare(results, baseline, max_regression):
+    """Compare each stage and route present in both runs; True if nothing regressed"""
+    baseline_stages = {stage["concurrency"]: stage for stage in baseline["stages"]}
+    regressions = []
+    for stage in results["stages"]:
+        previous = baseline_stages.get(stage["concurrency"])
+        if not previous:
+            continue
+        for route, figures in stage["routes"].items():
+            before = previous["routes"].get(route)
+            if not before:
+                continue
+            if figures["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+                regressions.append(f"{route} @ {stage['concurrency']}: p95 {before['p95_ms']} -> {figures['p95_ms']}ms")
+            if figures["rps"] < before["rps"] * (1 - max_regression):
+                regressions.append(f"{route} @ {stage['concurrency']}: rps {before['rps']} -> {figures['rps']}")
+
+    print(f"\n🔍 Compared with baseline from {baseline.get('started_at')} (commit {baseline.get('commit')})")
+    for regression in regressions:
+        print(f"❌ {regression}")
+    if not regressions:
+        print(f"✅ No route slowed down by more than {max_regression:.0%}")
+    return not regressions
+
+
+async def run(args):
+    stack = None
+    base_url = args.base_url
+    admin_email, admin_password = args.admin_email, args.admin_password
+    try:
+        if not base_url:
+            stack = LocalStack(args)
+            base_url = await stack.start()
+            admin_email, admin_password = f"load_admin_{uuid.uuid4().hex[:6]}@saahaz.com", uuid.uuid4().hex
+            stack.create_admin(admin_email, admin_password)
+        api_url = f"{base_url.rstrip('/')}/api"
+
+        connector = aiohttp.TCPConnector(limit=max(args.stages) + 10)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            admin_headers = await login(session, api_url, admin_email, admin_password)
+            print(f"🌱 Seeding {args.products} products in {args.categories} categories...")
+            product_ids = await seed_catalog(session, api_url, admin_headers, args.products, args.categories)
+            actions = make_actions(api_url, product_ids, admin_headers)
+
+            results = {
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "commit": git_commit(),
+                "settings": {k: v for k, v in vars(args).items() if k not in ("admin_password", "baseline", "output")},
+                "stages": []
+            }
+            for concurrency in args.stages:
+                stage = await run_stage(session, actions, concurrency, args.stage_seconds)
+                print_stage(stage)
+                results["stages"].append(stage)
+    finally:
+        if stack:
+            stack.stop()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results saved to {args.output}")
+
+    success = all(figures["errors"] == 0 for stage in results["stages"] for figures in stage["routes"].values())
+    if not success:
+        print("❌ Some requests failed")
+    if args.baseline:
+        with open(args.baseline) as f:
+            success = compare(results, json.load(f), args.max_regression) and success
+    return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shop traffic load test with per-route latency percentiles")
+    parser.add_argument("--stages", type=int, nargs="+", default=[1, 10, 25, 50],
+                        help="concurrency of each ramp stage")
+    parser.add_argument("--stage-seconds", type=float, default=15)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--output", default=f"load_results_{datetime.now():%Y%m%d_%H%M%S}.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative p95 increase / throughput drop against the baseline")
+
+    server_options = parser.add_argument_group("local server")
+    server_options.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    server_options.add_argument("--start-mongod", action="store_true", help="start a temporary mongod")
+    server_options.add_argument("--mongod", default="mongod", help="mongod binary for --start-mongod")
+    server_options.add_argument("--mongod-port", type=int, default=27099)
+    server_options.add_argument("--port", type=int, default=8099)
+    server_options.add_argument("--workers", type=int, default=1)
+
+    remote_options = parser.add_argument_group("running server")
+    remote_options.add_argument("--base-url", help="load an already running server instead of booting one")
+    remote_options.add_argument("--admin-email", default=os.environ.get("ADMIN_EMAIL", "test@saahaz.com"))
+    remote_options.add_argument("--admin-password", default=os.environ.get("ADMIN_PASSWORD", "password"))
+    args = parser.parse_args()
+
+    success = asyncio.run(run(args))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
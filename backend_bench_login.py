@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark.
+
+Measures the latency of a cheap route (GET /api/) while the server is idle and
+again during a storm of concurrent logins. With bcrypt running off the event
+loop the probe latency should stay flat; logins beyond the hashing queue limit
+are shed with 503 instead of piling up.
+
+All logins come from one address, so the server must run with rate limiting
+off (RATE_LIMIT_ENABLED=false, the default); otherwise the storm is cut to a
+handful of logins and the run stops with an error.
+
+Usage:
+    python backend_bench_login.py --base-url http://localhost:8001 --logins 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+import aiohttp
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def probe(session, api_url, stop, samples, interval):
+    """Hit the cheapest route repeatedly and record its latency"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        async with session.get(f"{api_url}/") as resp:
+            await resp.read()
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def login_storm(session, api_url, credentials, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = []
+
+    async def login():
+        async with semaphore:
+            async with session.post(f"{api_url}/auth/login", json=credentials) as resp:
+                await resp.read()
+                statuses.append(resp.status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(total)])
+    return statuses, time.perf_counter() - start
+
+
+async def run(args):
+    api_url = f"{args.base_url.rstrip('/')}/api"
+    credentials = {"email": f"bench_{uuid.uuid4().hex[:8]}@saahaz.com", "password": "BenchPassword123"}
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency + 5)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async with session.post(f"{api_url}/auth/register", json={**credentials, "name": "Bench User"}) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"Registration failed with status {resp.status}")
+
+        # Idle baseline
+        idle_samples = []
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(session, api_url, stop, idle_samples, args.probe_interval))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        await probe_task
+
+        # Same probe during the login storm
+        storm_samples = []
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(session, api_url, stop, storm_samples, args.probe_interval))
+        statuses, storm_time = await login_storm(session, api_url, credentials, args.logins, args.concurrency)
+        stop.set()
+        await probe_task
+
+    if 429 in statuses:
+        raise RuntimeError(f"{statuses.count(429)} logins were rate limited; run the server with RATE_LIMIT_ENABLED=false")
+    succeeded = statuses.count(200)
+    shed = statuses.count(503)
+    other = len(statuses) - succeeded - shed
+    idle_p50, idle_p99 = percentile(idle_samples, 0.5), percentile(idle_samples, 0.99)
+    storm_p50, storm_p99 = percentile(storm_samples, 0.5), percentile(storm_samples, 0.99)
+
+    print(f"🔐 {args.logins} logins at concurrency {args.concurrency} in {storm_time:.2f}s")
+    print(f"   Throughput: {succeeded / storm_time:.1f} successful logins/s")
+    print(f"   Succeeded: {succeeded}  Shed (503): {shed}  Other: {other}")
+    print(f"   Probe latency idle:  p50 {idle_p50 * 1000:.1f}ms  p99 {idle_p99 * 1000:.1f}ms  "
+          f"mean {statistics.mean(idle_samples) * 1000:.1f}ms ({len(idle_samples)} samples)")
+    print(f"   Probe latency storm: p50 {storm_p50 * 1000:.1f}ms  p99 {storm_p99 * 1000:.1f}ms  "
+          f"mean {statistics.mean(storm_samples) * 1000:.1f}ms ({len(storm_samples)} samples)")
+
+    checks = {
+        "event loop stays responsive": storm_p99 <= idle_p99 * args.max_slowdown + args.slack_ms / 1000,
+        "logins succeed or are shed cleanly": other == 0 and succeeded > 0,
+    }
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return all(checks.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login storm / event-loop latency benchmark")
+    parser.add_argument("--base-url", default=os.environ.get("BACKEND_URL", "http://localhost:8001"))
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--idle-seconds", type=float, default=3.0)
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    parser.add_argument("--max-slowdown", type=float, default=3.0,
+                        help="allowed ratio of storm p99 to idle p99 probe latency")
+    parser.add_argument("--slack-ms", type=float, default=20.0,
+                        help="absolute latency allowance on top of the ratio")
+    args = parser.parse_args()
+
+    success = asyncio.run(run(args))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
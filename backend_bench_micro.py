@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the backend functions every request touches.
+
+Measures the per-call cost of token creation and decoding, password
+verification, turning documents into Product/Order list response bodies
+(through the models and through the fast path), order item formatting and
+the email HTML builders, at realistic sizes. Runs offline; no database or
+server is needed.
+
+Timings are compared with the committed baseline file, which also pins each
+benchmark's allowed regression (--threshold, or three standard deviations of
+the recorded runs if larger). The run fails when a median per-call time
+grows past it, or when there is no baseline to compare with. Baselines depend
+on the machine, so re-record one on the machine that runs the comparison:
+
+Usage:
+    python backend_bench_micro.py --save-baseline      # record the baseline
+    python backend_bench_micro.py                      # compare with it
+    python backend_bench_micro.py --filter email --threshold 0.5   # override
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saahaz_bench")
+
+import jwt  # noqa: E402
+
+import server  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).parent / "backend_bench_micro_baseline.json"
+DEFAULT_THRESHOLD = 0.25
+
+
+def product_document(n):
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"Embroidered Kurta {n}",
+        "description": "Hand embroidered cotton kurta with a relaxed fit and side pockets.",
+        "price": 2500.0 + n % 50,
+        "category_id": str(uuid.uuid4()),
+        "images": [f"https://images.example.com/products/{n}/{i}.jpg" for i in range(3)],
+        "sizes": ["S", "M", "L", "XL"],
+        "colors": ["Black", "White", "Maroon"],
+        "inventory": n % 40,
+        "featured": n % 10 == 0,
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=n),
+    }
+
+
+def order_items(count):
+    return [
+        {"product_id": str(uuid.uuid4()), "quantity": 1 + i % 3, "size": "M", "color": "Black"}
+        for i in range(count)
+    ]
+
+
+def order_document(n, items=3):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "customer_name": f"Customer {n}",
+        "customer_email": f"customer{n}@example.com",
+        "items": order_items(items),
+        "subtotal": 7500.0,
+        "delivery_charge": 200.0,
+        "total_amount": 7700.0,
+        "status": "pending",
+        "delivery_address": "House 12, Street 4, Karachi",
+        "phone": "03000000000",
+        "delivery_option": "standard",
+        "payment_method": "cod",
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=n),
+        "updated_at": datetime(2024, 1, 1) + timedelta(minutes=n),
+    }
+
+
+def benchmarks():
+    """name -> zero-argument callable, one call being one operation"""
+    user_id = str(uuid.uuid4())
+    token = server.create_access_token({"sub": user_id, "admin": True})
+    password_hash = server.get_password_hash("CorrectHorse123")
+    products_100 = [product_document(n) for n in range(100)]
+    products_1000 = [product_document(n) for n in range(1000)]
+    orders_100 = [order_document(n) for n in range(100)]
+    order = order_document(0, items=5)
+    items = {size: order_items(size) for size in (1, 5, 20)}
+
+    # Both paths turn documents into the JSON body of a list response. Each call
+    # gets fresh dicts, as from a Motor cursor, since fill_defaults works in place
+    def model_body(model, documents):
+        return lambda: server.JSONResponse(
+            content=server.jsonable_encoder([model(**dict(d)) for d in documents])
+        ).body
+
+    def fast_body(model, documents):
+        return lambda: server.orjson.dumps([server.fill_defaults(model, dict(d)) for d in documents],
+                                           option=server.FAST_JSON_OPTIONS)
+
+    return {
+        "create_access_token": lambda: server.create_access_token({"sub": user_id, "admin": True}),
+        "jwt.decode": lambda: jwt.decode(token, server.SECRET_KEY, algorithms=[server.ALGORITHM]),
+        "decode_token": lambda: server.decode_token(token),
+        f"verify_password (bcrypt {server.BCRYPT_ROUNDS} rounds)":
+            lambda: server.verify_password("CorrectHorse123", password_hash),
+        "Product list body x100 (models)": model_body(server.Product, products_100),
+        "Product list body x1000 (models)": model_body(server.Product, products_1000),
+        "Product list body x1000 (fast path)": fast_body(server.Product, products_1000),
+        "Order list body x100 (models)": model_body(server.Order, orders_100),
+        "Order list body x100 (fast path)": fast_body(server.Order, orders_100),
+        **{f"_format_order_items x{size}": (lambda i=i: server._format_order_items(i)) for size, i in items.items()},
+        "build_order_confirmation_email (5 items)":
+            lambda: server.build_order_confirmation_email("Ayesha Khan", order),
+        "build_order_status_update_email":
+            lambda: server.build_order_status_update_email("Ayesha Khan", order, "shipped"),
+    }
+
+
+def measure(func, repeat, min_time):
+    """Per-call seconds for each of `repeat` runs of an automatically sized loop"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f}{unit}"
+    return f"{seconds / 1e-9:8.0f}ns"
+
+
+def run(args):
+    results = {}
+    for name, func in benchmarks().items():
+        if args.filter and args.filter.lower() not in name.lower():
+            continue
+        samples = measure(func, args.repeat, args.min_time)
+        results[name] = {
+            "median": statistics.median(samples),
+            "min": min(samples),
+            "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        }
+        print(f"   {name:<44} median {format_time(results[name]['median'])}  min {format_time(results[name]['min'])}")
+
+    if args.save_baseline:
+        floor = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+        for figures in results.values():
+            # Noisy benchmarks get room for three standard deviations, in steps of 5%
+            spread = 3 * figures["stdev"] / figures["median"]
+            figures["threshold"] = max(floor, math.ceil(spread * 20) / 20)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "results": results
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\n💾 Baseline saved to {args.baseline}")
+        return True
+
+    if not Path(args.baseline).exists():
+        print(f"\n❌ No baseline at {args.baseline}; record one with --save-baseline")
+        return False
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    print(f"\n🔍 Against {args.baseline}")
+    regressions = 0
+    for name, figures in results.items():
+        before = baseline.get(name)
+        if not before:
+            print(f"   {name}: not in baseline")
+            continue
+        threshold = before.get("threshold", DEFAULT_THRESHOLD) if args.threshold is None else args.threshold
+        change = figures["median"] / before["median"] - 1
+        regressed = change > threshold
+        regressions += regressed
+        print(f"{'❌' if regressed else '✅'} {name:<44} {change:+7.1%}  (limit +{threshold:.0%})")
+    return regressions == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call cost of the backend's hot functions")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--threshold", type=float,
+                        help="allowed relative increase of the median per-call time; overrides the baseline's "
+                             f"(recorded with --save-baseline, default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--repeat", type=int, default=7, help="timed runs per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed run")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+List endpoint serialization benchmark.
+
+Measures the per-item cost of turning Mongo documents into a JSON response
+body for products and orders, at 1k and 10k rows:
+
+  models: build a Pydantic model per document, validate the list again
+          against response_model and encode with the stdlib encoder (what
+          FastAPI does for handlers that return models)
+  fast:   fill model defaults into the projected documents and encode them
+          directly with orjson (FAST_JSON_RESPONSES=true)
+
+Documents vary the way stored data does: some have integer prices and
+totals, as backend/setup_data.py seeds them, and some lack created_at, which
+both paths fill with the current UTC time. The bodies are compared with
+number types kept (2500 differs from 2500.0); filled in timestamps are
+compared by format only, as each path reads the clock separately.
+
+Runs offline; no database or server is needed.
+
+Usage:
+    python backend_bench_serialization.py --sizes 1000 10000 --repeat 5
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saahaz_bench")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import server  # noqa: E402
+
+
+def product_document(i):
+    document = {
+        "id": str(uuid.uuid4()),
+        "name": f"Embroidered Kurta {i}",
+        "description": "Hand embroidered cotton kurta with a relaxed fit and side pockets.",
+        # Every other price is stored as an integer
+        "price": 2500 + i % 50 if i % 2 else 2500.5 + i % 50,
+        "category_id": str(uuid.uuid4()),
+        "images": [f"https://images.example.com/products/{i}/{n}.jpg" for n in range(3)],
+        "sizes": ["S", "M", "L", "XL"],
+        "colors": ["Black", "White", "Maroon"],
+        "inventory": i % 40,
+        "featured": i % 10 == 0,
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=i),
+    }
+    if i % 3 == 0:
+        del document["created_at"]
+    return document
+
+
+def order_document(i):
+    document = {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "customer_name": f"Customer {i}",
+        "customer_email": f"customer{i}@example.com",
+        "items": [
+            {"product_id": str(uuid.uuid4()), "quantity": 1 + n, "size": "M", "color": "Black"}
+            for n in range(3)
+        ],
+        "subtotal": 7500 if i % 2 else 7500.0,
+        "delivery_charge": 200 if i % 2 else 200.0,
+        "total_amount": 7700 if i % 2 else 7700.0,
+        "status": "pending",
+        "delivery_address": "House 12, Street 4, Karachi",
+        "phone": "03000000000",
+        "delivery_option": "standard",
+        "payment_method": "cod",
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=i),
+        "updated_at": datetime(2024, 1, 1) + timedelta(minutes=i),
+    }
+    if i % 3 == 0:
+        del document["created_at"], document["updated_at"]
+    return document
+
+
+def comparable(body, documents):
+    """The parsed body with number types kept and filled in timestamps reduced to their format"""
+    items = json.loads(body, parse_float=lambda s: ("float", s), parse_int=lambda s: ("int", s))
+    for item, document in zip(items, documents):
+        for name in ("created_at", "updated_at"):
+            if name in item and name not in document:
+                item[name] = re.sub(r"\d", "0", item[name])
+    return items
+
+
+def models_body(model, field, documents):
+    models = [model(**{k: v for k, v in document.items() if k != "_id"}) for document in documents]
+    content = asyncio.run(serialize_response(field=field, response_content=models))
+    return JSONResponse(content=content).body
+
+
+def fast_body(model, field, documents):
+    return server.orjson.dumps([server.fill_defaults(model, document) for document in documents],
+                               option=server.FAST_JSON_OPTIONS)
+
+
+def measure(encode, model, field, documents, repeat):
+    """Best of repeat runs; each run gets fresh copies as the fast path fills defaults in place"""
+    best, body = None, None
+    for _ in range(repeat):
+        batch = copy.deepcopy(documents)
+        start = time.perf_counter()
+        body = encode(model, field, batch)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+def run(args):
+    cases = [("products", server.Product, product_document), ("orders", server.Order, order_document)]
+    success = True
+    for name, model, make_document in cases:
+        field = create_response_field(name=f"Response_{name}", type_=List[model], mode="serialization")
+        for size in args.sizes:
+            documents = [make_document(i) for i in range(size)]
+            models_time, models_json = measure(models_body, model, field, documents, args.repeat)
+            fast_time, fast_json = measure(fast_body, model, field, documents, args.repeat)
+            same_output = comparable(models_json, documents) == comparable(fast_json, documents)
+            success = success and same_output
+
+            print(f"📦 {name}, {size} rows")
+            print(f"   models: {models_time * 1e6 / size:7.2f}µs/item  ({models_time * 1000:.1f}ms)")
+            print(f"   fast:   {fast_time * 1e6 / size:7.2f}µs/item  ({fast_time * 1000:.1f}ms)")
+            print(f"   Speedup: {models_time / fast_time:.1f}x")
+            print(f"{'✅' if same_output else '❌'} identical JSON")
+    return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-item serialization cost, Pydantic models vs orjson")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the best is reported")
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tracing overhead benchmark.
+
+Sends requests in-process through the full middleware stack to the API root
+route, which does no I/O, so the tracing cost is as large a share of the
+request as it can be, and compares tracing off with the sample rates given.
+Run to run noise on a busy machine is often larger than 1%, so the check uses
+an estimate built from steadier figures instead: the cost of recording and
+encoding one span, times the spans of a sampled request (--spans-per-request,
+e.g. auth, a few Mongo commands and an email for an order), times the rate,
+against the root route's time plus a round trip (--command-ms) per command.
+
+Finished spans are exported to a local stand-in for an OTLP/HTTP collector,
+which checks that they arrive as valid trace requests. Runs offline; no
+database is needed.
+
+Usage:
+    python backend_bench_tracing.py --requests 5000 --rates 0.01 0.1 1
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saahaz_bench")
+os.environ.setdefault("METRICS_ENABLED", "true")
+
+import server  # noqa: E402
+
+
+class CommandEvent:
+    """Just the fields the tracing listener reads from pymongo's command events"""
+
+    def __init__(self, request_id):
+        self.command_name = "find"
+        self.command = {"find": "products", "filter": {"id": "product"}}
+        self.connection_id = ("127.0.0.1", 27017)
+        self.request_id = request_id
+        self.duration_micros = 500
+
+
+async def start_collector():
+    """Stand-in OTLP/HTTP collector counting the spans it receives"""
+    received = {"requests": 0, "spans": 0}
+
+    async def traces(request):
+        payload = await request.json()
+        received["requests"] += 1
+        for resource_spans in payload["resourceSpans"]:
+            for scope_spans in resource_spans["scopeSpans"]:
+                received["spans"] += len(scope_spans["spans"])
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post("/v1/traces", traces)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/traces", received
+
+
+async def time_requests(client, total):
+    start = time.perf_counter()
+    for _ in range(total):
+        response = await client.get("/api/")
+        response.raise_for_status()
+    return (time.perf_counter() - start) / total
+
+
+def time_span_cost(total):
+    """Seconds to record one child span and encode it for export"""
+    root = server.Span("bench")
+    start = time.perf_counter()
+    with root:
+        for _ in range(total):
+            with server.start_span("child", kind="client", **{"db.operation": "find"}):
+                pass
+    spans = list(server._finished_spans)
+    server._finished_spans.clear()
+    server.orjson.dumps(server.otlp_payload(spans))
+    return (time.perf_counter() - start) / total
+
+
+def time_listener(total, sampled):
+    listener = server.MongoCommandTracing()
+    events = [CommandEvent(n) for n in range(total)]
+    span = server.Span("bench") if sampled else server.NO_SPAN
+    start = time.perf_counter()
+    with span:
+        for event in events:
+            listener.started(event)
+            listener.succeeded(event)
+    return (time.perf_counter() - start) / total
+
+
+async def run(args):
+    runner, url, received = await start_collector()
+    server.TRACE_EXPORTER = "otlp"
+    server.TRACE_OTLP_ENDPOINT = url
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Metrics stay on, as in a monitored production deployment
+            server.TRACE_SAMPLE_RATE = 0
+            await time_requests(client, min(args.requests, 500))  # warm up
+            print(f"🔍 {args.requests} requests per run, best of {args.repeat}")
+
+            off_times = []
+            for rate in args.rates:
+                # Alternate the runs so drift in machine load hits both sides alike
+                off, on = [], []
+                for _ in range(args.repeat):
+                    server.TRACE_SAMPLE_RATE = 0
+                    off.append(await time_requests(client, args.requests))
+                    server.TRACE_SAMPLE_RATE = rate
+                    on.append(await time_requests(client, args.requests))
+                    await server.export_spans()
+                off_times += off
+                print(f"   sample rate {rate:<6} {min(on) * 1e6:8.1f}µs/request  "
+                      f"(off {min(off) * 1e6:.1f}µs)  {min(on) / min(off) - 1:+7.2%}")
+            server.TRACE_SAMPLE_RATE = 0
+
+        unsampled = time_listener(args.requests, sampled=False)
+        sampled = time_listener(args.requests, sampled=True)
+        print(f"   Mongo listener     {unsampled * 1e6:8.2f}µs/command unsampled, {sampled * 1e6:.2f}µs sampled")
+        span_cost = min(time_span_cost(args.requests) for _ in range(args.repeat))
+        request_time = min(off_times) + args.spans_per_request * args.command_ms / 1000
+        # Every request pays the unsampled listener check on each of its commands
+        estimate = args.spans_per_request * (args.rates[0] * span_cost + unsampled) / request_time
+        print(f"   One span           {span_cost * 1e6:8.2f}µs recorded and encoded")
+        print(f"   Estimated overhead at {args.rates[0]}: {estimate:.3%} "
+              f"({args.spans_per_request} spans per sampled request)")
+        await server.stop_tracing()
+        print(f"   Collector received {received['spans']} spans in {received['requests']} requests")
+
+        checks = {
+            f"estimated overhead below {args.max_overhead:.0%} at sample rate {args.rates[0]}":
+                estimate < args.max_overhead,
+            "spans reached the collector": received["spans"] > 0,
+        }
+        for name, passed in checks.items():
+            print(f"{'✅' if passed else '❌'} {name}")
+        return all(checks.values())
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request overhead of tracing at several sample rates")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per sample rate, the best is reported")
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.01, 0.1, 1.0],
+                        help="sample rates to compare; the first is checked against --max-overhead")
+    parser.add_argument("--spans-per-request", type=int, default=10)
+    parser.add_argument("--command-ms", type=float, default=0.5,
+                        help="MongoDB round trip assumed for each command of that request")
+    parser.add_argument("--max-overhead", type=float, default=0.01)
+    args = parser.parse_args()
+
+    success = asyncio.run(run(args))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
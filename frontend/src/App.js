@@ -56,6 +56,94 @@ import {
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 const API = `${BACKEND_URL}/api`;
 
+// Follow the X-Next-Cursor header until every page of a cursor-paginated list is loaded
+const fetchAllPages = async (url, params = {}) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(url, {
+      params: { ...params, limit: 500, ...(cursor ? { cursor } : {}) }
+    });
+    items.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return items;
+};
+
+// Must match PRODUCT_BATCH_MAX_IDS on the backend
+const PRODUCT_BATCH_SIZE = 100;
+
+// Fetch many products in as few requests as possible; returns a map of id -> product
+// with missing products left out
+const fetchProductsByIds = async (productIds) => {
+  const uniqueIds = [...new Set(productIds)];
+  const chunks = [];
+  for (let i = 0; i < uniqueIds.length; i += PRODUCT_BATCH_SIZE) {
+    chunks.push(uniqueIds.slice(i, i + PRODUCT_BATCH_SIZE));
+  }
+  const responses = await Promise.all(
+    chunks.map(ids => axios.post(`${API}/products/batch`, { ids }))
+  );
+  const productsMap = {};
+  responses.forEach(response => {
+    Object.entries(response.data.products).forEach(([id, product]) => {
+      if (product) {
+        productsMap[id] = product;
+      }
+    });
+  });
+  return productsMap;
+};
+
+// Access tokens are short-lived; keep them fresh with the refresh token
+const storeTokens = (accessToken, refreshToken) => {
+  localStorage.setItem('token', accessToken);
+  if (refreshToken) {
+    localStorage.setItem('refresh_token', refreshToken);
+  }
+  axios.defaults.headers.common['Authorization'] = `Bearer ${accessToken}`;
+};
+
+let refreshPromise = null;
+
+const refreshAccessToken = async () => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) {
+    throw new Error('No refresh token');
+  }
+  // Concurrent 401s share a single refresh, since refresh tokens are single use
+  if (!refreshPromise) {
+    refreshPromise = axios.post(`${API}/auth/refresh`, { refresh_token: refreshToken })
+      .then(response => {
+        storeTokens(response.data.access_token, response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
+axios.interceptors.response.use(
+  response => response,
+  async error => {
+    const request = error.config;
+    const isAuthCall = request && request.url && request.url.includes('/auth/');
+    if (error.response?.status === 401 && request && !request._retried && !isAuthCall) {
+      request._retried = true;
+      try {
+        const accessToken = await refreshAccessToken();
+        request.headers['Authorization'] = `Bearer ${accessToken}`;
+        return axios(request);
+      } catch (refreshError) {
+        localStorage.removeItem('refresh_token');
+      }
+    }
+    return Promise.reject(error);
+  }
+);
+
 // Context for authentication and cart
 const AppContext = createContext();
 
@@ -196,6 +284,7 @@ const Header = ({ onMenuClick, cartCount }) => {
   const [isSearchOpen, setIsSearchOpen] = useState(false);
   const [searchQuery, setSearchQuery] = useState('');
   const [searchResults, setSearchResults] = useState([]);
+  const [searchTotal, setSearchTotal] = useState(0);
   const [isSearching, setIsSearching] = useState(false);
   const { user, logout } = useAppContext();
 
@@ -208,19 +297,17 @@ const Header = ({ onMenuClick, cartCount }) => {
 
     setIsSearching(true);
     try {
-      // Search products by name or description
-      const response = await axios.get(`${API}/products`);
-      const allProducts = response.data;
-      
-      const filteredProducts = allProducts.filter(product =>
-        product.name.toLowerCase().includes(query.toLowerCase()) ||
-        product.description.toLowerCase().includes(query.toLowerCase())
-      );
+      // Ranked search over name, description, colors and sizes on the server
+      const response = await axios.get(`${API}/products/search`, {
+        params: { q: query.trim(), limit: 20 }
+      });
       
-      setSearchResults(filteredProducts);
+      setSearchResults(response.data.results);
+      setSearchTotal(response.data.total);
     } catch (error) {
       console.error('Search error:', error);
       setSearchResults([]);
+      setSearchTotal(0);
     } finally {
       setIsSearching(false);
     }
@@ -486,7 +573,7 @@ const Header = ({ onMenuClick, cartCount }) => {
                       setIsSearchOpen(false);
                     }}
                   >
-                    View all {searchResults.length} results
+                    View all {searchTotal} results
                   </div>
                 )}
               </div>
@@ -900,6 +987,7 @@ const AdminDashboard = () => {
   const [products, setProducts] = useState([]);
   const [categories, setCategories] = useState([]);
   const [orders, setOrders] = useState([]);
+  const [ordersLoaded, setOrdersLoaded] = useState(false);
   const [loading, setLoading] = useState(true);
   const { toast, showToast, hideToast } = useToast();
 
@@ -920,22 +1008,19 @@ const AdminDashboard = () => {
         console.log('AdminDashboard: Starting data fetch...');
         setLoading(true);
         
-        // Fetch products, categories, and orders for admin
-        const [productsRes, categoriesRes, ordersRes] = await Promise.all([
-          axios.get(`${API}/products`),
-          axios.get(`${API}/categories`),
-          axios.get(`${API}/orders`)
+        // Orders are loaded when the Orders tab is opened; analytics come from /admin/stats
+        const [allProducts, categoriesRes] = await Promise.all([
+          fetchAllPages(`${API}/products`),
+          axios.get(`${API}/categories`)
         ]);
         
         console.log('AdminDashboard: Data fetched successfully:', {
-          productsCount: productsRes.data?.length,
-          categoriesCount: categoriesRes.data?.length,
-          ordersCount: ordersRes.data?.length
+          productsCount: allProducts.length,
+          categoriesCount: categoriesRes.data?.length
         });
         
-        setProducts(productsRes.data);
+        setProducts(allProducts);
         setCategories(categoriesRes.data);
-        setOrders(ordersRes.data);
       } catch (error) {
         console.error('AdminDashboard: Error fetching admin data:', error);
         console.error('Error details:', {
@@ -951,6 +1036,23 @@ const AdminDashboard = () => {
     fetchAdminData();
   }, [user]);
 
+  useEffect(() => {
+    if (activeTab !== 'orders' || ordersLoaded || !user?.is_admin) {
+      return;
+    }
+
+    const fetchOrders = async () => {
+      try {
+        setOrders(await fetchAllPages(`${API}/orders`));
+        setOrdersLoaded(true);
+      } catch (error) {
+        console.error('AdminDashboard: Error fetching orders:', error);
+      }
+    };
+
+    fetchOrders();
+  }, [activeTab, ordersLoaded, user]);
+
   if (!user) {
     return (
       <div className="min-h-screen flex items-center justify-center">
@@ -1062,7 +1164,7 @@ const AdminDashboard = () => {
           </TabsContent>
 
           <TabsContent value="analytics" className="mt-8">
-            <AdminAnalyticsTab products={products} orders={orders} />
+            <AdminAnalyticsTab />
           </TabsContent>
         </Tabs>
       </div>
@@ -2073,79 +2175,61 @@ const AdminOrdersTab = ({ orders, setOrders, showToast }) => {
 };
 
 // Admin Analytics Tab - Enhanced
-const AdminAnalyticsTab = ({ products, orders }) => {
+const AdminAnalyticsTab = () => {
   const [dateRange, setDateRange] = useState('30'); // days
   const [analyticsData, setAnalyticsData] = useState({});
 
-  const calculateAnalytics = () => {
-    const now = new Date();
-    const daysAgo = new Date(now.getTime() - (parseInt(dateRange) * 24 * 60 * 60 * 1000));
-    const filteredOrders = orders.filter(order => new Date(order.created_at) >= daysAgo);
-    
-    const totalRevenue = filteredOrders.reduce((sum, order) => sum + order.total_amount, 0);
-    const totalOrders = filteredOrders.length;
-    const avgOrderValue = totalOrders > 0 ? totalRevenue / totalOrders : 0;
-    
-    // Order status breakdown
-    const statusBreakdown = {
-      pending: filteredOrders.filter(o => o.status === 'pending').length,
-      confirmed: filteredOrders.filter(o => o.status === 'confirmed').length,  
-      shipped: filteredOrders.filter(o => o.status === 'shipped').length,
-      delivered: filteredOrders.filter(o => o.status === 'delivered').length,
-      cancelled: filteredOrders.filter(o => o.status === 'cancelled').length
-    };
-    
-    // Top selling products
-    const productSales = {};
-    filteredOrders.forEach(order => {
-      order.items.forEach(item => {
-        if (productSales[item.product_id]) {
-          productSales[item.product_id] += item.quantity;
-        } else {
-          productSales[item.product_id] = item.quantity;
-        }
-      });
+  // Figures are aggregated by the backend; only the last 7 days are shown day by day
+  const toAnalyticsData = (stats) => {
+    const statusBreakdown = { pending: 0, confirmed: 0, shipped: 0, delivered: 0, cancelled: 0 };
+    Object.entries(stats.revenue_by_status || {}).forEach(([status, group]) => {
+      statusBreakdown[status] = group.orders;
     });
-    
-    const topProducts = Object.entries(productSales)
-      .sort((a, b) => b[1] - a[1])
-      .slice(0, 5)
-      .map(([productId, quantity]) => ({
-        product: products.find(p => p.id === productId),
-        quantity
-      }));
-    
-    // Daily sales data (last 7 days)
+
+    const salesByDate = {};
+    (stats.orders_per_day || []).forEach(day => {
+      salesByDate[day.date] = day;
+    });
+    const now = new Date();
     const dailySales = [];
     for (let i = 6; i >= 0; i--) {
       const date = new Date(now.getTime() - (i * 24 * 60 * 60 * 1000));
-      const dayOrders = filteredOrders.filter(order => {
-        const orderDate = new Date(order.created_at);
-        return orderDate.toDateString() === date.toDateString();
-      });
-      const dayRevenue = dayOrders.reduce((sum, order) => sum + order.total_amount, 0);
+      const day = salesByDate[date.toISOString().slice(0, 10)];
       dailySales.push({
         date: date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
-        revenue: dayRevenue,
-        orders: dayOrders.length
+        revenue: day ? day.revenue : 0,
+        orders: day ? day.orders : 0
       });
     }
-    
+
     return {
-      totalRevenue,
-      totalOrders,
-      avgOrderValue,
+      totalRevenue: stats.total_revenue,
+      totalOrders: stats.total_orders,
+      avgOrderValue: stats.avg_order_value,
       statusBreakdown,
-      topProducts,
+      topProducts: (stats.top_products || []).map(item => ({
+        product: item.name ? { name: item.name, price: item.price } : null,
+        quantity: item.quantity
+      })),
       dailySales,
-      totalProducts: products.length,
-      lowStockProducts: products.filter(p => p.inventory < 10).length
+      totalProducts: stats.total_products,
+      lowStockProducts: stats.low_stock_count,
+      lowStockList: stats.low_stock_products || []
     };
   };
 
   useEffect(() => {
-    setAnalyticsData(calculateAnalytics());
-  }, [dateRange, orders, products]);
+    const fetchStats = async () => {
+      try {
+        const response = await axios.get(`${API}/admin/stats`, { params: { days: dateRange } });
+        setAnalyticsData(toAnalyticsData(response.data));
+      } catch (error) {
+        console.error('Error fetching admin stats:', error);
+      }
+    };
+
+    fetchStats();
+  }, [dateRange]);
 
   const printAnalytics = () => {
     const printContent = `
@@ -2376,7 +2460,7 @@ const AdminAnalyticsTab = ({ products, orders }) => {
                 </p>
               </div>
               
-              {products.filter(p => p.inventory < 10).slice(0, 5).map(product => (
+              {(analyticsData.lowStockList || []).map(product => (
                 <div key={product.id} className="flex items-center justify-between p-2 border rounded">
                   <div>
                     <p className="font-medium">{product.name}</p>
@@ -2756,15 +2840,8 @@ const ShoppingCart = () => {
 
       try {
         setLoading(true);
-        // Get unique product IDs
-        const uniqueProductIds = [...new Set(cart.map(item => item.product_id))];
-        
-        const productPromises = uniqueProductIds.map(productId =>
-          axios.get(`${API}/products/${productId}`)
-        );
-        
-        const responses = await Promise.all(productPromises);
-        const fetchedProducts = responses.map(response => response.data);
+        const productsMap = await fetchProductsByIds(cart.map(item => item.product_id));
+        const fetchedProducts = Object.values(productsMap);
         setProducts(fetchedProducts);
         
         // Calculate total
@@ -2939,25 +3016,13 @@ const CustomerOrders = () => {
   useEffect(() => {
     const fetchOrders = async () => {
       try {
-        const response = await axios.get(`${API}/orders`);
-        setOrders(response.data);
+        const userOrders = await fetchAllPages(`${API}/orders`);
+        setOrders(userOrders);
         
         // Fetch product details for all orders
-        const allProductIds = [...new Set(
-          response.data.flatMap(order => order.items.map(item => item.product_id))
-        )];
-        
-        const productPromises = allProductIds.map(id => 
-          axios.get(`${API}/products/${id}`).catch(() => null)
+        const productsMap = await fetchProductsByIds(
+          userOrders.flatMap(order => order.items.map(item => item.product_id))
         );
-        const productResponses = await Promise.all(productPromises);
-        
-        const productsMap = {};
-        productResponses.forEach((response, index) => {
-          if (response && response.data) {
-            productsMap[allProductIds[index]] = response.data;
-          }
-        });
         setOrderProducts(productsMap);
         
       } catch (error) {
@@ -3467,8 +3532,38 @@ const ProductsPage = () => {
   const [products, setProducts] = useState([]);
   const [categories, setCategories] = useState([]);
   const [selectedCategory, setSelectedCategory] = useState('');
+  const [sortOption, setSortOption] = useState('created_at:desc');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [totalProducts, setTotalProducts] = useState(0);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
 
+  const fetchProductsPage = (cursor = null) => {
+    const [sort, order] = sortOption.split(':');
+    return axios.get(`${API}/products`, {
+      params: {
+        sort,
+        order,
+        limit: 24,
+        ...(selectedCategory ? { category_id: selectedCategory } : {}),
+        ...(cursor ? { cursor } : {})
+      }
+    });
+  };
+
+  const handleLoadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await fetchProductsPage(nextCursor);
+      setProducts(prev => [...prev, ...response.data]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching more products:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     // Get category from URL parameters
     const urlParams = new URLSearchParams(window.location.search);
@@ -3483,10 +3578,12 @@ const ProductsPage = () => {
       try {
         setLoading(true);
         const [productsRes, categoriesRes] = await Promise.all([
-          axios.get(`${API}/products${selectedCategory ? `?category_id=${selectedCategory}` : ''}`),
+          fetchProductsPage(),
           axios.get(`${API}/categories`)
         ]);
         setProducts(productsRes.data);
+        setNextCursor(productsRes.headers['x-next-cursor'] || null);
+        setTotalProducts(Number(productsRes.headers['x-total-count'] || productsRes.data.length));
         setCategories(categoriesRes.data);
       } catch (error) {
         console.error('Error fetching products:', error);
@@ -3496,7 +3593,7 @@ const ProductsPage = () => {
     };
 
     fetchData();
-  }, [selectedCategory]);
+  }, [selectedCategory, sortOption]);
 
   if (loading) {
     return (
@@ -3529,6 +3626,16 @@ const ProductsPage = () => {
                 {category.name}
               </Button>
             ))}
+            <select
+              className="ml-auto p-2 border rounded-md text-sm"
+              value={sortOption}
+              onChange={(e) => setSortOption(e.target.value)}
+            >
+              <option value="created_at:desc">Newest</option>
+              <option value="price:asc">Price: Low to High</option>
+              <option value="price:desc">Price: High to Low</option>
+              <option value="name:asc">Name: A to Z</option>
+            </select>
           </div>
         </div>
 
@@ -3539,6 +3646,14 @@ const ProductsPage = () => {
           ))}
         </div>
 
+        {nextCursor && (
+          <div className="text-center mt-8">
+            <Button variant="outline" onClick={handleLoadMore} disabled={loadingMore}>
+              {loadingMore ? 'Loading...' : `Load more (${products.length} of ${totalProducts})`}
+            </Button>
+          </div>
+        )}
+
         {products.length === 0 && (
           <div className="text-center py-12">
             <Package className="h-24 w-24 mx-auto mb-4 text-muted-foreground" />
@@ -3815,13 +3930,8 @@ const CheckoutPage = () => {
       }
 
       try {
-        const uniqueProductIds = [...new Set(cart.map(item => item.product_id))];
-        const productPromises = uniqueProductIds.map(productId =>
-          axios.get(`${API}/products/${productId}`)
-        );
-        
-        const responses = await Promise.all(productPromises);
-        const fetchedProducts = responses.map(response => response.data);
+        const productsMap = await fetchProductsByIds(cart.map(item => item.product_id));
+        const fetchedProducts = Object.values(productsMap);
         setProducts(fetchedProducts);
         
         // Calculate total
@@ -4447,10 +4557,9 @@ const AppProvider = ({ children }) => {
     try {
       setLoading(true);
       const response = await axios.post(`${API}/auth/login`, { email, password });
-      const { access_token, user: userData } = response.data;
+      const { access_token, refresh_token, user: userData } = response.data;
       
-      localStorage.setItem('token', access_token);
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      storeTokens(access_token, refresh_token);
       setUser(userData);
     } catch (error) {
       console.error('Login error:', error);
@@ -4464,10 +4573,9 @@ const AppProvider = ({ children }) => {
     try {
       setLoading(true);
       const response = await axios.post(`${API}/auth/register`, userData);
-      const { access_token, user: newUser } = response.data;
+      const { access_token, refresh_token, user: newUser } = response.data;
       
-      localStorage.setItem('token', access_token);
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      storeTokens(access_token, refresh_token);
       setUser(newUser);
     } catch (error) {
       console.error('Register error:', error);
@@ -4478,7 +4586,11 @@ const AppProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revoke tokens on the server; the local session is cleared either way
+    const refreshToken = localStorage.getItem('refresh_token');
+    axios.post(`${API}/auth/logout`, { refresh_token: refreshToken }).catch(() => {});
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     localStorage.removeItem('saahaz_cart'); // Clear cart on logout
     delete axios.defaults.headers.common['Authorization'];
     setUser(null);
@@ -4571,6 +4683,7 @@ const AppProvider = ({ children }) => {
           console.error('Token validation failed:', error);
           // Token is invalid, clear it
           localStorage.removeItem('token');
+          localStorage.removeItem('refresh_token');
           delete axios.defaults.headers.common['Authorization'];
           setUser(null);
         }